@@ -1,14 +1,39 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, send_from_directory, make_response, session, has_request_context, abort, g
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 # Cambiar sqlite3 por mysql.connector
 import mysql.connector
-from mysql.connector import Error
-from werkzeug.security import generate_password_hash, check_password_hash  # ✅ AGREGADO: Seguridad de contraseñas
+from mysql.connector import Error, IntegrityError
+from mysql.connector.errors import PoolError
 import os
 import json
+import time
+import uuid
+import hashlib
+import threading
 import csv
+import asyncio
+import contextvars
+import inspect
 from datetime import datetime
+from functools import partial, wraps
 from io import StringIO, BytesIO
+from collections import Counter
+from conexion.replicas import DatabaseRouter, parse_replica_hosts
+from conexion.tiendas import DEFAULT_SHARD, ShardRouter, parse_store_shards
+from conexion.asincrona import AsyncDatabase, CONNECTION_ERRNOS
+from conexion.admision import AdmissionControl, AdmittedConnection, CircuitBreaker, ServicioNoDisponible, StaleCache
+from sugerencias import SuggestionIndex
+from trabajos import JobRunner, CREATE_TABLE_SQL as CREATE_JOBS_TABLE_SQL
+from catalogo_binario import write_snapshot
+from importacion import FORMATOS_PARALELOS, iter_parsed_chunks, validate_product
+from libros import HotIsbnCache, normalize_isbn
+from compresion import compress_response
+from fragmentos import FragmentCache
+from contrasenas import PasswordHasher, HasherBusy  # ✅ AGREGADO: Seguridad de contraseñas
+from perfilador import RequestProfiler
+from existencias import StockBuffer, journal_pid
+from trabajos import process_alive
+from markupsafe import Markup
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'tu_clave_secreta_muy_segura_2024')  # ✅ MEJORADO: Variable de entorno
@@ -28,11 +53,108 @@ MYSQL_CONFIG = {
     'password': os.getenv('DB_PASSWORD', '')  # ✅ CAMBIADO: Sin contraseña por defecto
 }
 
+# Pool de conexiones por proceso (cada worker de gunicorn crea el suyo tras el fork)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+
+# Réplicas de solo lectura: DB_REPLICAS="host1:3307,host2:3306"
+DB_REPLICAS = parse_replica_hosts(os.getenv('DB_REPLICAS', ''))
+# Segundos que una sesión lee del primario después de escribir (read-your-writes)
+DB_STICKY_SECONDS = float(os.getenv('DB_STICKY_SECONDS', '5'))
+
+db_router = DatabaseRouter(MYSQL_CONFIG, DB_REPLICAS, DB_POOL_SIZE)
+
+# Stock por tienda repartido en shards: STORE_SHARDS="1=db-norte:3306,2=db-norte,3=db-sur:3307"
+# (las tiendas que no aparecen viven en la base de datos principal)
+STORE_SHARDS = parse_store_shards(os.getenv('STORE_SHARDS', ''))
+store_shards = ShardRouter(MYSQL_CONFIG, STORE_SHARDS, DB_POOL_SIZE,
+                           default_connection=lambda read_only: get_mysql_connection(read_only))
+
+# Pool aparte para el trabajo fuera de las peticiones (importaciones, consultas
+# en paralelo a los shards, escritura diferida de stock): el pool principal
+# queda para los hilos de petición que deja pasar DB_MAX_INFLIGHT. Por defecto,
+# dos conexiones por trabajo de importación (la tarea y su progreso), una por
+# shard y una para el stock diferido.
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', '2'))
+DB_BACKGROUND_POOL_SIZE = int(os.getenv('DB_BACKGROUND_POOL_SIZE',
+                                        str(2 * IMPORT_WORKERS + len(store_shards.shard_names()) + 1)))
+background_router = DatabaseRouter(MYSQL_CONFIG, [], DB_BACKGROUND_POOL_SIZE)
+
+# Control de admisión por worker: peticiones con trabajo simultáneo en MySQL
+# (por defecto el tamaño del pool) y segundos máximos de espera en cola
+DB_MAX_INFLIGHT = int(os.getenv('DB_MAX_INFLIGHT', str(DB_POOL_SIZE)))
+DB_QUEUE_TIMEOUT = float(os.getenv('DB_QUEUE_TIMEOUT', '1'))
+# Circuito: fallos de conexión seguidos que lo abren y segundos hasta reintentar
+DB_BREAKER_THRESHOLD = int(os.getenv('DB_BREAKER_THRESHOLD', '5'))
+DB_BREAKER_RESET = float(os.getenv('DB_BREAKER_RESET', '10'))
+
+db_admission = AdmissionControl(DB_MAX_INFLIGHT, DB_QUEUE_TIMEOUT)
+db_breaker = CircuitBreaker(DB_BREAKER_THRESHOLD, DB_BREAKER_RESET)
+
+# Modo asíncrono (ASYNC_DB=1, requiere aiomysql y flask[async]): /inventario y
+# /dashboard lanzan sus consultas en paralelo con un pool aiomysql propio
+ASYNC_DB = os.getenv('ASYNC_DB', '0').lower() in ('1', 'true', 'si', 'sí')
+async_db = AsyncDatabase(MYSQL_CONFIG, DB_REPLICAS, int(os.getenv('ASYNC_DB_POOL_SIZE', '10')))
+
+def _note_stale_read(name):
+    """Avisa (una vez por petición) de que se muestran datos guardados"""
+    if has_request_context() and not g.get('_datos_en_cache'):
+        g._datos_en_cache = True
+        flash('La base de datos no responde: se muestran los últimos datos disponibles.', 'warning')
+
+# Últimas lecturas correctas, para las rutas de consulta con el circuito abierto
+stale_reads = StaleCache(max_entries=int(os.getenv('STALE_CACHE_SIZE', '512')), on_stale=_note_stale_read)
+
 # Configuración de archivos (mantener igual)
 DATA_DIR = 'datos'
 TXT_FILE = os.path.join(DATA_DIR, 'datos.txt')
 JSON_FILE = os.path.join(DATA_DIR, 'datos.json')
 CSV_FILE = os.path.join(DATA_DIR, 'datos.csv')
+BIN_FILE = os.path.join(DATA_DIR, 'datos.bin')
+IMPORT_DIR = os.path.join(DATA_DIR, 'importaciones')
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+# Importación paralela (CSV y JSON Lines): a partir de qué tamaño se usa,
+# procesos que validan (por defecto uno por núcleo) y bytes por trozo
+IMPORT_PARALLEL_MIN_BYTES = int(os.getenv('IMPORT_PARALLEL_MIN_BYTES', str(8 * 1024 * 1024)))
+IMPORT_PROCESSES = int(os.getenv('IMPORT_PROCESSES', '0')) or os.cpu_count() or 1
+IMPORT_CHUNK_BYTES = int(os.getenv('IMPORT_CHUNK_BYTES', str(8 * 1024 * 1024)))
+# Ajustes de stock diferidos: diario local, segundos entre escrituras por lote
+# y si cada ajuste se fuerza a disco (fsync) antes de responder
+STOCK_JOURNAL_DIR = os.path.join(DATA_DIR, 'diario_stock')
+STOCK_FLUSH_INTERVAL = float(os.getenv('STOCK_FLUSH_INTERVAL', '1'))
+STOCK_JOURNAL_FSYNC = os.getenv('STOCK_JOURNAL_FSYNC', '1').lower() in ('1', 'true', 'si', 'sí')
+
+# Compresión de respuestas (bytes mínimos para comprimir)
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+# Segundos que se reutiliza la versión del catálogo leída de MySQL
+CATALOG_VERSION_TTL = float(os.getenv('CATALOG_VERSION_TTL', '1'))
+
+# Hash de contraseñas: método/coste (formato de werkzeug, p. ej. 'scrypt' o
+# 'pbkdf2:sha256:600000'), hilos dedicados y límite de operaciones en espera
+password_hasher = PasswordHasher(
+    method=os.getenv('PASSWORD_HASH_METHOD', 'scrypt'),
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', '2')),
+    max_pending=int(os.getenv('PASSWORD_HASH_MAX_PENDING', '16')),
+    queue_timeout=float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', '2'))
+)
+
+# Usuarios por página en la administración de usuarios
+USERS_PAGE_SIZE = int(os.getenv('USERS_PAGE_SIZE', '50'))
+
+# Archivos estáticos con huella generados por build_assets.py
+ASSETS_DIR = os.path.join(app.root_path, 'static', 'dist')
+ASSETS_MANIFEST = os.path.join(ASSETS_DIR, 'manifest.json')
+ASSETS_MAX_AGE = 31536000  # un año
+
+# Perfilador por muestreo: fracción de peticiones perfiladas (0 = solo las que
+# traen la cabecera X-Perfil firmada) e intervalo entre muestras en ms
+PROFILE_DIR = os.path.join('datos', 'perfiles')
+profiler = RequestProfiler(
+    PROFILE_DIR,
+    sample_rate=float(os.getenv('PROFILER_SAMPLE_RATE', '0')),
+    interval=float(os.getenv('PROFILER_INTERVAL_MS', '5')) / 1000,
+    max_files=int(os.getenv('PROFILER_MAX_FILES', '200'))
+)
+profiler.init_app(app)
 
 # ✅ AGREGADO: Modelo de Usuario para Flask-Login
 class User(UserMixin):
@@ -42,6 +164,7 @@ class User(UserMixin):
         self.email = email
 
 @login_manager.user_loader
+@stale_reads.fallback
 def load_user(user_id):
     """Cargar usuario por ID para Flask-Login"""
     connection = get_mysql_connection()
@@ -65,14 +188,278 @@ def ensure_data_directory():
         os.makedirs(DATA_DIR)
 
 # NUEVAS FUNCIONES PARA MYSQL
-def get_mysql_connection():
-    """Obtiene una conexión a MySQL"""
+def reset_connection_pool():
+    """Descarta los pools actuales (se usa tras el fork de cada worker)"""
+    db_router.reset()
+    background_router.reset()
+    store_shards.reset()
+    async_db.reset()
+
+def mark_primary_write():
+    """Marca que la sesión acaba de escribir: sus lecturas irán al primario un tiempo"""
+    if has_request_context():
+        session['_db_write_ts'] = time.time()
+
+def reads_use_primary():
+    """Indica si las lecturas deben ir al primario para ver las propias escrituras"""
+    if not DB_REPLICAS or not has_request_context():
+        # Fuera de una petición (arranque, exportaciones) se lee del primario
+        return True
+    return time.time() - session.get('_db_write_ts', 0) < DB_STICKY_SECONDS
+
+def get_mysql_connection(read_only=False):
+    """Obtiene una conexión a MySQL: primario para escrituras, réplica para lecturas
+    
+    Dentro de una petición pasa por el control de admisión y el circuito: si
+    MySQL está saturado o caído lanza ServicioNoDisponible (respuesta 503).
+    Fuera de una petición (arranque, trabajos en segundo plano) usa el pool
+    de segundo plano, siempre contra el primario, y devuelve None si falla.
+    """
+    in_request = has_request_context()
+    try:
+        # Primero el hueco de admisión: si la conexión de prueba del circuito
+        # se rechazara aquí, nadie informaría su resultado y no se cerraría
+        if in_request:
+            _acquire_request_slot()
+        try:
+            db_breaker.before_call()
+        except ServicioNoDisponible:
+            if in_request:
+                _release_request_slot()
+            raise
+    except ServicioNoDisponible as e:
+        if in_request:
+            raise
+        print(f"Error al conectar a MySQL: {e}")
+        return None
+    
     try:
-        connection = mysql.connector.connect(**MYSQL_CONFIG)
-        return connection
+        if in_request:
+            connection = db_router.get_connection(read_only and not reads_use_primary())
+        else:
+            connection = background_router.get_primary_connection()
+    except PoolError as e:
+        # Pool agotado: MySQL responde, así que no cuenta como fallo del circuito
+        db_breaker.record_success()
+        if in_request:
+            _release_request_slot()
+            raise ServicioNoDisponible(f'Sin conexiones libres: {e}') from e
+        print(f"Error al conectar a MySQL: {e}")
+        return None
     except Error as e:
+        db_breaker.record_failure()
         print(f"Error al conectar a MySQL: {e}")
+        if in_request:
+            _release_request_slot()
+            raise ServicioNoDisponible('No se pudo conectar a la base de datos',
+                                       retry_after=db_breaker.reset_timeout) from e
         return None
+    except BaseException:
+        db_breaker.abandon_probe()
+        if in_request:
+            _release_request_slot()
+        raise
+    
+    db_breaker.record_success()
+    if in_request:
+        return AdmittedConnection(connection, _release_request_slot)
+    return connection
+
+# El contador de cada petición se toca también desde los hilos de run_blocking
+_db_slot_lock = threading.Lock()
+
+def _acquire_request_slot():
+    """Reserva el hueco de admisión de la petición (uno solo aunque abra varias conexiones)"""
+    with _db_slot_lock:
+        depth = g.get('_db_slot_depth', 0)
+        if depth:
+            g._db_slot_depth = depth + 1
+            return
+    db_admission.acquire()
+    with _db_slot_lock:
+        g._db_slot_depth = g.get('_db_slot_depth', 0) + 1
+
+def _release_request_slot():
+    """Libera el hueco cuando la petición cierra su última conexión abierta"""
+    with _db_slot_lock:
+        g._db_slot_depth -= 1
+        if g._db_slot_depth:
+            return
+    db_admission.release()
+
+@app.teardown_request
+def release_db_slot(error=None):
+    """Devuelve el hueco si alguna conexión quedó sin cerrar"""
+    if g.get('_db_slot_depth'):
+        g._db_slot_depth = 0
+        db_admission.release()
+
+# ===== Versión del catálogo y validadores HTTP =====
+# Versiones leídas de `contadores`: nombre -> (valor, momento de la lectura)
+_versions = {}
+_versions_lock = threading.Lock()
+
+def bump_catalog_version(cursor, suggestions=True):
+    """Incrementa la versión del catálogo dentro de la transacción de escritura
+    
+    Con `suggestions` (altas, bajas, nombres y categorías; no los cambios de
+    solo stock) incrementa también la de las sugerencias y devuelve su nuevo
+    valor, para que el índice de este proceso no se reconstruya por su
+    propia escritura.
+    """
+    names = ('catalogo_version', 'sugerencias_version') if suggestions else ('catalogo_version',)
+    for name in names:
+        cursor.execute('''
+            INSERT INTO contadores (nombre, valor) VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE valor = valor + 1
+        ''', (name,))
+    with _versions_lock:
+        # Forzar una nueva lectura en este proceso
+        for name in names:
+            _versions.pop(name, None)
+    if not suggestions:
+        return None
+    # La fila queda bloqueada por el UPDATE hasta el commit: el valor es el nuestro
+    cursor.execute("SELECT valor FROM contadores WHERE nombre = 'sugerencias_version'")
+    rows = cursor.fetchall()  # Leer todo: el cursor sigue usándose en la transacción
+    return rows[0][0] if rows else None
+
+def read_version(name):
+    """Valor de un contador de versión, reutilizado CATALOG_VERSION_TTL segundos (None si no se puede leer)"""
+    with _versions_lock:
+        cached = _versions.get(name)
+        if cached and cached[0] is not None and time.monotonic() - cached[1] < CATALOG_VERSION_TTL:
+            return cached[0]
+    
+    # Se lee del primario: una réplica atrasada devolvería un 304 con datos viejos
+    try:
+        connection = get_mysql_connection()
+    except ServicioNoDisponible:
+        return None
+    if connection:
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT valor FROM contadores WHERE nombre = %s", (name,))
+            row = cursor.fetchone()
+            version = row[0] if row else None
+            with _versions_lock:
+                _versions[name] = (version, time.monotonic())
+            return version
+        except Error as e:
+            print(f"Error al leer {name}: {e}")
+        finally:
+            cursor.close()
+            connection.close()
+    return None
+
+def get_catalog_version():
+    """Versión actual del catálogo (None si no se puede leer)"""
+    return read_version('catalogo_version')
+
+def conditional_page(view):
+    """Responde 304 sin ejecutar la vista si el catálogo no cambió desde la última visita
+
+    El ETag débil combina la versión del catálogo, los ajustes de stock aún
+    no escritos en este proceso, la huella de los estáticos (otro despliegue,
+    otro HTML), el usuario y la URL completa.
+    Acepta también vistas async (se ejecutan con app.ensure_sync).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        run_view = app.ensure_sync(view)
+        # Con mensajes flash pendientes la página cambia aunque el catálogo no
+        if request.method != 'GET' or session.get('_flashes'):
+            return run_view(*args, **kwargs)
+        
+        version = get_catalog_version()
+        if version is None:
+            return run_view(*args, **kwargs)
+        
+        etag = hashlib.sha1(f'{version}|{stock_buffer.fingerprint()}|{get_assets_version()}|'
+                            f'{current_user.get_id()}|{request.full_path}'.encode()).hexdigest()[:24]
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(run_view(*args, **kwargs))
+        response.set_etag(etag, weak=True)
+        return response
+    return wrapper
+
+def with_pending_stock(func):
+    """Suma al resultado los ajustes de stock que aún no se escribieron en MySQL"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return stock_buffer.merge(func(*args, **kwargs))
+    return wrapper
+
+@app.after_request
+def add_cache_headers(response):
+    """Compresión y cabeceras de caché para las páginas autenticadas"""
+    # El tipo y el estado primero: los estáticos y los 503 no deben cargar el
+    # usuario (consulta a MySQL)
+    if (response.mimetype == 'text/html' and response.status_code != 503
+            and current_user.is_authenticated):
+        # Solo el navegador del usuario puede guardarla, y siempre revalidando
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+    return compress_response(response, request.accept_encodings, COMPRESS_MIN_SIZE)
+
+# ===== Archivos estáticos con huella =====
+_assets_manifest = None
+
+def get_assets_manifest():
+    """Manifest de build_assets.py (vacío si no se ejecutó el build)"""
+    global _assets_manifest
+    if _assets_manifest is None:
+        try:
+            with open(ASSETS_MANIFEST, 'r', encoding='utf-8') as f:
+                _assets_manifest = json.load(f)
+        except (OSError, ValueError):
+            _assets_manifest = {}
+    return _assets_manifest
+
+_assets_version = None
+
+def get_assets_version():
+    """Huella del manifest: cambia con cada build, es decir, con cada despliegue"""
+    global _assets_version
+    if _assets_version is None:
+        manifest = get_assets_manifest()
+        _assets_version = hashlib.sha1(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:12]
+    return _assets_version
+
+@app.template_global()
+def asset_url(filename):
+    """URL con huella de un archivo estático; sin build, la de /static de siempre"""
+    fingerprinted = get_assets_manifest().get(filename)
+    if fingerprinted:
+        return url_for('asset', filename=fingerprinted)
+    return url_for('static', filename=filename)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Sirve un archivo con huella, precomprimido si el cliente lo acepta"""
+    if filename not in get_assets_manifest().values():
+        abort(404)
+    
+    available = [encoding for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+                 if os.path.exists(os.path.join(ASSETS_DIR, filename + suffix))]
+    encoding = request.accept_encodings.best_match(available) if available else None
+    
+    mimetype = 'text/css' if filename.endswith('.css') else 'text/javascript'
+    if encoding:
+        suffix = '.br' if encoding == 'br' else '.gz'
+        response = send_from_directory(ASSETS_DIR, filename + suffix, mimetype=mimetype, max_age=ASSETS_MAX_AGE)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(ASSETS_DIR, filename, mimetype=mimetype, max_age=ASSETS_MAX_AGE)
+    
+    # El nombre cambia con el contenido: se puede guardar para siempre
+    response.cache_control.no_cache = None
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
 
 def init_db():
     """Inicializa la base de datos MySQL con las tablas necesarias"""
@@ -88,9 +475,14 @@ def init_db():
                     nombre VARCHAR(100) NOT NULL,
                     email VARCHAR(100) UNIQUE NOT NULL,
                     password VARCHAR(255) NOT NULL,
-                    fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_usuarios_registro (fecha_registro, id_usuario),
+                    INDEX idx_usuarios_nombre (nombre)
                 )
             ''')
+            # Tablas creadas antes de existir los índices
+            ensure_index(cursor, 'usuarios', 'idx_usuarios_registro', 'fecha_registro, id_usuario')
+            ensure_index(cursor, 'usuarios', 'idx_usuarios_nombre', 'nombre')
             
             # Crear tabla categorías
             cursor.execute('''
@@ -115,15 +507,109 @@ def init_db():
                 )
             ''')
             
+            # Tabla libros: el ISBN se guarda normalizado a 13 dígitos (índice único)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS libros (
+                    id_libro INT AUTO_INCREMENT PRIMARY KEY,
+                    titulo VARCHAR(200) NOT NULL,
+                    autor VARCHAR(150) NOT NULL,
+                    isbn VARCHAR(13) UNIQUE,
+                    id_categoria INT,
+                    precio DECIMAL(10,2),
+                    stock INT DEFAULT 0,
+                    fecha_ingreso TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (id_categoria) REFERENCES categorias(id_categoria)
+                )
+            ''')
+            
+            # Tiendas de la cadena (el stock de cada una va en su shard)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tiendas (
+                    id_tienda INT AUTO_INCREMENT PRIMARY KEY,
+                    nombre VARCHAR(100) NOT NULL UNIQUE,
+                    direccion VARCHAR(255),
+                    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Contadores mantenidos por la aplicación (versión del catálogo, etc.)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS contadores (
+                    nombre VARCHAR(50) PRIMARY KEY,
+                    valor BIGINT NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.execute("INSERT IGNORE INTO contadores (nombre, valor) VALUES ('catalogo_version', 1)")
+            cursor.execute("INSERT IGNORE INTO contadores (nombre, valor) VALUES ('sugerencias_version', 1)")
+            
+            # Total de usuarios: se cuenta una sola vez y luego lo mantiene el registro
+            cursor.execute("SELECT valor FROM contadores WHERE nombre = 'usuarios_total'")
+            if cursor.fetchone() is None:
+                cursor.execute('''
+                    INSERT INTO contadores (nombre, valor)
+                    SELECT 'usuarios_total', COUNT(*) FROM usuarios
+                ''')
+            
+            # Tabla de trabajos de importación en segundo plano
+            cursor.execute(CREATE_JOBS_TABLE_SQL)
+            ensure_column(cursor, 'trabajos_importacion', 'propietario', 'VARCHAR(100)')
+            
             connection.commit()
             print("Tablas creadas exitosamente")
             
+            # Los trabajos que quedaron a medias en un reinicio no se reanudan.
+            # Solo los de procesos muertos de esta máquina: en un despliegue con
+            # USR2 los workers viejos (y los de otras máquinas) siguen con los suyos
+            import_jobs.reclaim_orphans()
+            
+            # Ajustes de stock que quedaron en el diario sin llegar a MySQL
+            recover_stock_journal()
+            
+            # Tabla de stock por tienda en cada shard
+            _, errors = store_shards.map(create_store_stock_table, read_only=False)
+            for shard, error in errors.items():
+                print(f"Error al crear stock_tienda en {shard}: {error}")
+            
         except Error as e:
             print(f"Error al crear tablas: {e}")
         finally:
             cursor.close()
             connection.close()
 
+def ensure_index(cursor, table, name, columns):
+    """Crea un índice si todavía no existe (MySQL no admite CREATE INDEX IF NOT EXISTS)"""
+    try:
+        cursor.execute(f'CREATE INDEX {name} ON {table} ({columns})')
+    except Error as e:
+        if e.errno != 1061:  # ER_DUP_KEYNAME: el índice ya existe
+            raise
+
+def ensure_column(cursor, table, name, definition):
+    """Añade una columna si todavía no existe (tablas creadas por versiones anteriores)"""
+    try:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+    except Error as e:
+        if e.errno != 1060:  # ER_DUP_FIELDNAME: la columna ya existe
+            raise
+
+def create_store_stock_table(connection):
+    """Crea la tabla de stock por tienda en un shard"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_tienda (
+                id_tienda INT NOT NULL,
+                id_producto INT NOT NULL,
+                cantidad INT NOT NULL DEFAULT 0,
+                fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                PRIMARY KEY (id_tienda, id_producto),
+                INDEX idx_stock_producto (id_producto)
+            )
+        ''')
+        connection.commit()
+    finally:
+        cursor.close()
+
 # ✅ AGREGADO: Rutas de Autenticación
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -142,30 +628,31 @@ def register():
             flash('La contraseña debe tener al menos 6 caracteres', 'error')
             return render_template('register.html')
         
+        # ✅ HASH de la contraseña antes de guardarla (fuera de la conexión a MySQL)
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HasherBusy:
+            return _hasher_busy_response('register.html')
+        
         connection = get_mysql_connection()
         if connection:
             try:
                 cursor = connection.cursor()
                 
-                # Verificar si el usuario ya existe
-                cursor.execute('SELECT id_usuario FROM usuarios WHERE email = %s', (email,))
-                if cursor.fetchone():
-                    flash('El email ya está registrado', 'error')
-                    return render_template('register.html')
-                
-                # ✅ HASH de la contraseña antes de guardarla
-                hashed_password = generate_password_hash(password)
-                
-                # Insertar nuevo usuario
+                # Un solo INSERT: el índice único de email detecta los duplicados
                 cursor.execute('''
                     INSERT INTO usuarios (nombre, email, password) 
                     VALUES (%s, %s, %s)
                 ''', (nombre, email, hashed_password))
+                cursor.execute("UPDATE contadores SET valor = valor + 1 WHERE nombre = 'usuarios_total'")
                 
                 connection.commit()
+                mark_primary_write()
                 flash('Usuario registrado exitosamente. Puedes iniciar sesión.', 'success')
                 return redirect(url_for('login'))
                 
+            except IntegrityError:
+                flash('El email ya está registrado', 'error')
             except Error as e:
                 flash(f'Error al registrar usuario: {e}', 'error')
             finally:
@@ -185,33 +672,69 @@ def login():
             flash('Email y contraseña son obligatorios', 'error')
             return render_template('login.html')
         
+        user_data = None
         connection = get_mysql_connection()
         if connection:
             try:
                 cursor = connection.cursor(dictionary=True)
-                cursor.execute('SELECT * FROM usuarios WHERE email = %s', (email,))
+                cursor.execute('SELECT id_usuario, nombre, password FROM usuarios WHERE email = %s', (email,))
                 user_data = cursor.fetchone()
-                
-                # ✅ VERIFICAR hash de contraseña
-                if user_data and check_password_hash(user_data['password'], password):
-                    user = User(user_data['id_usuario'], user_data['nombre'], user_data['email'])
-                    login_user(user)
-                    flash(f'¡Bienvenido, {user.nombre}!', 'success')
-                    
-                    # Redirigir a la página solicitada o al dashboard
-                    next_page = request.args.get('next')
-                    return redirect(next_page) if next_page else redirect(url_for('dashboard'))
-                else:
-                    flash('Email o contraseña incorrectos', 'error')
-                    
             except Error as e:
                 flash(f'Error al iniciar sesión: {e}', 'error')
+                return render_template('login.html')
             finally:
+                # La conexión vuelve al pool antes de calcular el hash
                 cursor.close()
                 connection.close()
+        
+        try:
+            # ✅ VERIFICAR hash de contraseña
+            valid = bool(user_data) and password_hasher.verify(user_data['password'], password)
+        except HasherBusy:
+            return _hasher_busy_response('login.html')
+        
+        if valid:
+            if password_hasher.needs_rehash(user_data['password']):
+                rehash_password(user_data['id_usuario'], password)
+            
+            user = User(user_data['id_usuario'], user_data['nombre'], email)
+            login_user(user)
+            flash(f'¡Bienvenido, {user.nombre}!', 'success')
+            
+            # Redirigir a la página solicitada o al dashboard
+            next_page = request.args.get('next')
+            return redirect(next_page) if next_page else redirect(url_for('dashboard'))
+        elif connection:
+            flash('Email o contraseña incorrectos', 'error')
     
     return render_template('login.html')
 
+def rehash_password(user_id, password):
+    """Actualiza el hash guardado al método y coste configurados (tras un login correcto)"""
+    try:
+        new_hash = password_hasher.hash(password)
+    except HasherBusy:
+        return  # Se reintentará en el próximo inicio de sesión
+    
+    connection = get_mysql_connection()
+    if connection:
+        try:
+            cursor = connection.cursor()
+            cursor.execute('UPDATE usuarios SET password = %s WHERE id_usuario = %s', (new_hash, user_id))
+            connection.commit()
+        except Error as e:
+            print(f"Error al actualizar hash de contraseña: {e}")
+        finally:
+            cursor.close()
+            connection.close()
+
+def _hasher_busy_response(template):
+    """Respuesta 503 cuando el pool de hash está saturado"""
+    flash('El servidor está ocupado. Intenta de nuevo en unos segundos.', 'warning')
+    response = make_response(render_template(template), 503)
+    response.headers['Retry-After'] = '2'
+    return response
+
 @app.route('/logout')
 @login_required
 def logout():
@@ -223,10 +746,21 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    """Panel principal protegido"""
-    stats = get_stats()
+    """Panel principal protegido: estadísticas de una sucursal (?tienda=) o de toda la cadena
+    
+    Sin validación por ETag: el stock de las tiendas cambia sin tocar la
+    versión del catálogo.
+    """
+    tienda = request.args.get('tienda', type=int)
+    if tienda:
+        stats = get_store_stats(tienda)
+        chain_stats = None
+    else:
+        stats = get_stats()
+        chain_stats = get_chain_stats()
     recent_products = get_all_products()[:5]
-    return render_template('dashboard.html', stats=stats, recent_products=recent_products)
+    return render_template('dashboard.html', stats=stats, recent_products=recent_products,
+                           chain_stats=chain_stats, tiendas=get_stores(), tienda_actual=tienda)
 
 # RUTA REQUERIDA PARA LA TAREA
 @app.route('/test_db')
@@ -253,9 +787,11 @@ def test_database():
             'message': f'Error al conectar: {e}'
         })
 
+@with_pending_stock
+@stale_reads.fallback
 def get_all_products():
     """Obtiene todos los productos de la base de datos MySQL"""
-    connection = get_mysql_connection()
+    connection = get_mysql_connection(read_only=True)
     if connection:
         try:
             cursor = connection.cursor(dictionary=True)
@@ -270,9 +806,11 @@ def get_all_products():
             connection.close()
     return []
 
+@with_pending_stock
+@stale_reads.fallback
 def get_product_by_id(product_id):
     """Obtiene un producto por su ID"""
-    connection = get_mysql_connection()
+    connection = get_mysql_connection(read_only=True)
     if connection:
         try:
             cursor = connection.cursor(dictionary=True)
@@ -307,9 +845,11 @@ def product_exists_by_name(name, exclude_id=None):
             connection.close()
     return False
 
+@with_pending_stock
+@stale_reads.fallback
 def search_products(term, search_type='nombre'):
     """Busca productos por nombre o categoría"""
-    connection = get_mysql_connection()
+    connection = get_mysql_connection(read_only=True)
     if connection:
         try:
             cursor = connection.cursor(dictionary=True)
@@ -338,9 +878,10 @@ def search_products(term, search_type='nombre'):
             connection.close()
     return []
 
+@stale_reads.fallback
 def get_categories():
     """Obtiene todas las categorías únicas"""
-    connection = get_mysql_connection()
+    connection = get_mysql_connection(read_only=True)
     if connection:
         try:
             cursor = connection.cursor()
@@ -359,9 +900,10 @@ def get_categories():
             connection.close()
     return []
 
+@stale_reads.fallback
 def get_stats():
     """Obtiene estadísticas del inventario"""
-    connection = get_mysql_connection()
+    connection = get_mysql_connection(read_only=True)
     if connection:
         try:
             cursor = connection.cursor()
@@ -392,25 +934,132 @@ def get_stats():
             connection.close()
     return {'total_products': 0, 'total_value': 0, 'low_stock': 0, 'categories': 0}
 
+# Índice de sugerencias en memoria: se reconstruye si otro worker cambió
+# productos (versión en `contadores`) o, como mucho, cada SUGGEST_INDEX_TTL segundos
+suggestion_index = SuggestionIndex(get_all_products, ttl=int(os.getenv('SUGGEST_INDEX_TTL', '300')),
+                                   version=lambda: read_version('sugerencias_version'))
+
+@app.route('/api/sugerencias')
+@login_required
+def api_sugerencias():
+    """Sugerencias de búsqueda mientras se escribe"""
+    term = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limite', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+
+    sugerencias = []
+    for item in suggestion_index.suggest(term, limit):
+        if item['tipo'] == 'producto':
+            item['url'] = url_for('ver_producto', product_id=item['id'])
+        else:
+            item['url'] = url_for('buscar', q=item['categoria'], type='categoria')
+        sugerencias.append(item)
+    return jsonify({'term': term, 'sugerencias': sugerencias})
+
 # ✅ ACTUALIZADO: Gestión de usuarios mejorada
 @app.route('/usuarios')
 @login_required  # ✅ PROTEGIDO: Requiere login
 def usuarios():
-    """Mostrar lista de usuarios"""
-    connection = get_mysql_connection()
+    """Mostrar lista de usuarios, paginada del más reciente al más antiguo"""
+    term = request.args.get('q', '').strip()
+    after = parse_user_cursor(request.args.get('despues'))
+    before = None if after else parse_user_cursor(request.args.get('antes'))
+    
+    users, has_more = get_users_page(term, after=after, before=before)
+    
+    # Con `antes` se retrocede: siempre hay una página siguiente
+    has_next = has_more if not before else True
+    has_prev = bool(after) or (bool(before) and has_more)
+    context = {
+        'usuarios': users,
+        'term': term,
+        'total_usuarios': get_users_total(),
+        'cursor_siguiente': user_cursor(users[-1]) if users and has_next else None,
+        'cursor_anterior': user_cursor(users[0]) if users and has_prev else None,
+    }
+    return render_template('usuarios.html', **context)
+
+def user_cursor(user):
+    """Posición de un usuario en el orden (fecha_registro, id_usuario) para paginar"""
+    return f"{user['fecha_registro']}|{user['id_usuario']}"
+
+def parse_user_cursor(value):
+    """Convierte el cursor de la URL en (fecha_registro, id_usuario); None si no es válido"""
+    if not value:
+        return None
+    fecha, _, user_id = value.rpartition('|')
+    try:
+        datetime.strptime(fecha, '%Y-%m-%d %H:%M:%S')
+        return fecha, int(user_id)
+    except ValueError:
+        return None
+
+def get_users_page(term='', after=None, before=None, limit=USERS_PAGE_SIZE):
+    """Una página de usuarios por keyset sobre (fecha_registro, id_usuario)
+    
+    `after` avanza hacia usuarios más antiguos y `before` retrocede hacia los
+    más recientes. Con `term` se filtra por prefijo de nombre o de email (cada
+    rama usa su índice). Devuelve (usuarios, hay_mas).
+    """
+    if before:
+        keyset = 'AND (fecha_registro > %s OR (fecha_registro = %s AND id_usuario > %s))'
+        keyset_params = (before[0], before[0], before[1])
+        order = 'fecha_registro ASC, id_usuario ASC'
+    else:
+        keyset = 'AND (fecha_registro < %s OR (fecha_registro = %s AND id_usuario < %s))' if after else ''
+        keyset_params = (after[0], after[0], after[1]) if after else ()
+        order = 'fecha_registro DESC, id_usuario DESC'
+    
+    columns = 'SELECT id_usuario, nombre, email, fecha_registro FROM usuarios'
+    if term:
+        prefix = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        sql = f'''
+            ({columns} WHERE nombre LIKE %s {keyset} ORDER BY {order} LIMIT %s)
+            UNION
+            ({columns} WHERE email LIKE %s {keyset} ORDER BY {order} LIMIT %s)
+            ORDER BY {order} LIMIT %s
+        '''
+        params = (prefix,) + keyset_params + (limit + 1, prefix) + keyset_params + (limit + 1, limit + 1)
+    else:
+        sql = f'{columns} WHERE 1 = 1 {keyset} ORDER BY {order} LIMIT %s'
+        params = keyset_params + (limit + 1,)
+    
+    connection = get_mysql_connection(read_only=True)
     if connection:
         try:
             cursor = connection.cursor(dictionary=True)
-            cursor.execute('SELECT id_usuario, nombre, email, fecha_registro FROM usuarios ORDER BY fecha_registro DESC')
-            usuarios = cursor.fetchall()
-            return render_template('usuarios.html', usuarios=usuarios)
+            cursor.execute(sql, params)
+            users = cursor.fetchall()
+            has_more = len(users) > limit
+            users = users[:limit]
+            if before:
+                users.reverse()
+            return users, has_more
         except Error as e:
             flash(f'Error al obtener usuarios: {e}', 'error')
-            return render_template('usuarios.html', usuarios=[])
         finally:
             cursor.close()
             connection.close()
-    return render_template('usuarios.html', usuarios=[])
+    return [], False
+
+@stale_reads.fallback
+def get_users_total():
+    """Total de usuarios desde el contador mantenido (sin COUNT(*) sobre la tabla)"""
+    connection = get_mysql_connection(read_only=True)
+    if connection:
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT valor FROM contadores WHERE nombre = 'usuarios_total'")
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Error as e:
+            print(f"Error al leer el total de usuarios: {e}")
+        finally:
+            cursor.close()
+            connection.close()
+    return None
 
 # Todas las demás funciones y rutas permanecen iguales pero con @login_required donde corresponda
 
@@ -424,6 +1073,7 @@ def index():
 
 @app.route('/inventario')
 @login_required
+@conditional_page
 def inventario():
     """Página del inventario completo"""
     products = get_all_products()
@@ -463,18 +1113,26 @@ def nuevo_producto():
             connection = get_mysql_connection()
             if connection:
                 cursor = connection.cursor()
-                cursor.execute('''
-                    INSERT INTO productos (nombre, descripcion, cantidad, precio, categoria)
-                    VALUES (%s, %s, %s, %s, %s)
-                ''', (nombre, descripcion, cantidad, precio, categoria))
-                connection.commit()
-                cursor.close()
-                connection.close()
+                try:
+                    cursor.execute('''
+                        INSERT INTO productos (nombre, descripcion, cantidad, precio, categoria)
+                        VALUES (%s, %s, %s, %s, %s)
+                    ''', (nombre, descripcion, cantidad, precio, categoria))
+                    product_id = cursor.lastrowid
+                    version = bump_catalog_version(cursor)
+                    connection.commit()
+                except Error:
+                    connection.rollback()
+                    raise
+                finally:
+                    # Devolver siempre la conexión al pool
+                    cursor.close()
+                    connection.close()
+                mark_primary_write()
+                suggestion_index.upsert({'id': product_id, 'nombre': nombre, 'categoria': categoria}, version)
             
             # Actualizar archivos de datos
-            export_to_txt()
-            export_to_json()
-            export_to_csv()
+            export_all_files()
             
             flash('Producto creado exitosamente', 'success')
             return redirect(url_for('inventario'))
@@ -522,23 +1180,33 @@ def editar_producto(product_id):
                 flash('El precio no puede ser negativo', 'error')
                 return render_template('producto_form.html', product=product, categories=get_categories())
             
+            # Los ajustes pendientes se escriben antes: la cantidad del formulario los incluye
+            stock_buffer.flush()
+            
             # Actualizar en base de datos MySQL
             connection = get_mysql_connection()
             if connection:
                 cursor = connection.cursor()
-                cursor.execute('''
-                    UPDATE productos 
-                    SET nombre=%s, descripcion=%s, cantidad=%s, precio=%s, categoria=%s
-                    WHERE id=%s
-                ''', (nombre, descripcion, cantidad, precio, categoria, product_id))
-                connection.commit()
-                cursor.close()
-                connection.close()
+                try:
+                    cursor.execute('''
+                        UPDATE productos 
+                        SET nombre=%s, descripcion=%s, cantidad=%s, precio=%s, categoria=%s
+                        WHERE id=%s
+                    ''', (nombre, descripcion, cantidad, precio, categoria, product_id))
+                    version = bump_catalog_version(cursor)
+                    connection.commit()
+                except Error:
+                    connection.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                    connection.close()
+                mark_primary_write()
+                suggestion_index.upsert({'id': product_id, 'nombre': nombre, 'categoria': categoria}, version)
+                fragment_cache.invalidate(product_id)
             
             # Actualizar archivos de datos
-            export_to_txt()
-            export_to_json()
-            export_to_csv()
+            export_all_files()
             
             flash('Producto actualizado exitosamente', 'success')
             return redirect(url_for('inventario'))
@@ -565,15 +1233,25 @@ def eliminar_producto(product_id):
         connection = get_mysql_connection()
         if connection:
             cursor = connection.cursor()
-            cursor.execute('DELETE FROM productos WHERE id = %s', (product_id,))
-            connection.commit()
-            cursor.close()
-            connection.close()
+            try:
+                cursor.execute('DELETE FROM productos WHERE id = %s', (product_id,))
+                version = bump_catalog_version(cursor)
+                connection.commit()
+            except Error:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+                connection.close()
+            mark_primary_write()
+            suggestion_index.remove(product_id, version)
+            fragment_cache.invalidate(product_id)
+            
+            # El stock de las tiendas está en otros shards (sin clave foránea)
+            delete_store_stock(product_id)
         
         # Actualizar archivos de datos
-        export_to_txt()
-        export_to_json()
-        export_to_csv()
+        export_all_files()
         
         flash('Producto eliminado exitosamente', 'success')
         
@@ -584,6 +1262,7 @@ def eliminar_producto(product_id):
 
 @app.route('/buscar')
 @login_required
+@conditional_page
 def buscar():
     """Página de búsqueda"""
     term = request.args.get('q', '').strip()
@@ -602,6 +1281,7 @@ def buscar():
 
 @app.route('/producto/<int:product_id>')
 @login_required
+@conditional_page
 def ver_producto(product_id):
     """Ver detalles de un producto"""
     product = get_product_by_id(product_id)
@@ -612,6 +1292,686 @@ def ver_producto(product_id):
     
     return render_template('producto_detalle.html', product=product)
 
+# ===== Ajustes de stock diferidos (escaneos de caja, recepción) =====
+# Productos por sentencia UPDATE al escribir un lote de ajustes
+STOCK_FLUSH_BATCH = int(os.getenv('STOCK_FLUSH_BATCH', '1000'))
+
+def stock_journal_counter(journal_id):
+    """Nombre en `contadores` de la última entrada aplicada de un diario"""
+    return f'diario:{journal_id}'
+
+def apply_stock_deltas(deltas, journal_id, last_seq):
+    """Escribe un lote de ajustes {id_producto: delta} en una sola transacción
+    
+    Cada bloque de STOCK_FLUSH_BATCH productos es un único UPDATE con CASE.
+    La posición del diario se guarda en la misma transacción, así que al
+    recuperar tras una caída ninguna entrada se aplica dos veces. Los deltas
+    se suman completos (las ventas no pasan por aquí, ver take_stock); los
+    productos ya eliminados se ignoran. Un lote vacío solo publica la versión.
+    """
+    connection = get_mysql_connection()
+    if not connection:
+        raise Error('No se pudo conectar a MySQL')
+    try:
+        cursor = connection.cursor()
+        ids = list(deltas)
+        for start in range(0, len(ids), STOCK_FLUSH_BATCH):
+            chunk = ids[start:start + STOCK_FLUSH_BATCH]
+            cases = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+            params = []
+            for product_id in chunk:
+                params.extend([product_id, deltas[product_id]])
+            cursor.execute(f'''
+                UPDATE productos SET cantidad = cantidad + CASE id {cases} ELSE 0 END
+                WHERE id IN ({', '.join(['%s'] * len(chunk))})
+            ''', params + chunk)
+        cursor.execute('''
+            INSERT INTO contadores (nombre, valor) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE valor = GREATEST(valor, VALUES(valor))
+        ''', (stock_journal_counter(journal_id), last_seq))
+        bump_catalog_version(cursor, suggestions=False)
+        connection.commit()
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+
+stock_buffer = StockBuffer(STOCK_JOURNAL_DIR, apply_stock_deltas,
+                           interval=STOCK_FLUSH_INTERVAL, fsync=STOCK_JOURNAL_FSYNC)
+
+def recover_stock_journal():
+    """Aplica los diarios de procesos que ya no existen (al arrancar y en cada worker nuevo)
+    
+    Un worker matado (timeout, SIGKILL) deja ajustes en su diario que no
+    llegaron a MySQL. El candado evita que dos workers nuevos recuperen el
+    mismo diario a la vez; la posición guardada, que se sume dos veces.
+    """
+    with stock_buffer.recovery_lock():
+        journals = stock_buffer.journals()
+        connection = get_mysql_connection()
+        if not connection:
+            return
+        try:
+            cursor = connection.cursor()
+            failed = set()
+            for journal_id, (entries, paths) in journals.items():
+                cursor.execute('SELECT valor FROM contadores WHERE nombre = %s', (stock_journal_counter(journal_id),))
+                row = cursor.fetchone()
+                connection.commit()  # Cerrar la lectura: la siguiente ve las posiciones nuevas
+                applied = row[0] if row else 0
+                deltas = {}
+                for seq, product_id, delta in entries:
+                    if seq > applied:
+                        deltas[product_id] = deltas.get(product_id, 0) + delta
+                try:
+                    if deltas:
+                        apply_stock_deltas(deltas, journal_id, max(seq for seq, _, _ in entries))
+                except Error as e:
+                    print(f"Error al recuperar el diario de stock {journal_id}: {e}")
+                    failed.add(journal_id)
+                    continue
+                for path in paths:
+                    os.remove(path)
+                if deltas:
+                    print(f"Diario de stock {journal_id}: {len(deltas)} productos recuperados")
+            
+            # Las posiciones de procesos terminados ya no hacen falta (las de los vivos, sí)
+            cursor.execute("SELECT nombre FROM contadores WHERE nombre LIKE 'diario:%'")
+            for (nombre,) in cursor.fetchall():
+                journal_id = nombre.split(':', 1)[1]
+                if journal_id not in failed and not process_alive(journal_pid(journal_id)):
+                    cursor.execute('DELETE FROM contadores WHERE nombre = %s', (nombre,))
+            connection.commit()
+        except Error as e:
+            print(f"Error al recuperar los diarios de stock: {e}")
+        finally:
+            cursor.close()
+            connection.close()
+
+def take_stock(product_id, units):
+    """Descuenta `units` en MySQL solo si hay suficientes; devuelve la cantidad final o None
+    
+    Es una sola sentencia condicional en el primario, así que dos workers no
+    pueden vender la misma unidad (con un delta diferido, cada worker solo
+    vería sus propias ventas pendientes). La versión del catálogo se publica
+    en el siguiente vaciado del buffer, no en cada venta.
+    """
+    connection = get_mysql_connection()
+    if not connection:
+        raise Error('No se pudo conectar a MySQL')
+    cursor = connection.cursor()
+    try:
+        cursor.execute('UPDATE productos SET cantidad = cantidad - %s WHERE id = %s AND cantidad >= %s',
+                       (units, product_id, units))
+        if not cursor.rowcount:
+            connection.rollback()
+            return None
+        cursor.execute('SELECT cantidad FROM productos WHERE id = %s', (product_id,))
+        final = cursor.fetchone()[0]
+        connection.commit()
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+    mark_primary_write()
+    stock_buffer.mark_dirty()
+    return final
+
+@app.route('/api/stock/<int:product_id>/ajuste', methods=['POST'])
+@login_required
+def api_ajuste_stock(product_id):
+    """Suma o resta unidades (`ajuste`) al stock de un producto
+    
+    Las entradas (recepción) quedan en el diario local y se escriben en MySQL
+    con las demás del mismo intervalo (STOCK_FLUSH_INTERVAL); las lecturas
+    de este worker ya las incluyen, las de otros tras la siguiente escritura.
+    Las salidas (ventas) se descuentan al momento con take_stock.
+    """
+    data = request.get_json(silent=True) or request.form
+    try:
+        delta = int(data.get('ajuste'))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'ajuste debe ser un entero'}), 400
+    if delta == 0:
+        return jsonify({'status': 'error', 'message': 'El ajuste no puede ser cero'}), 400
+    
+    if delta > 0:
+        product = get_product_by_id(product_id)
+        if not product:
+            return jsonify({'status': 'error', 'message': 'Producto no encontrado'}), 404
+        pending = stock_buffer.add(product_id, delta)
+        # Tras el vaciado el delta ya no se suma a las lecturas: una réplica
+        # atrasada mostraría a esta sesión la cantidad vieja (por eso
+        # DB_STICKY_SECONDS debe superar STOCK_FLUSH_INTERVAL)
+        mark_primary_write()
+        return jsonify({'status': 'success', 'id_producto': product_id,
+                        'cantidad': product['cantidad'] + delta, 'pendiente': pending})
+    
+    try:
+        final = take_stock(product_id, -delta)
+        if final is None and stock_buffer.pending(product_id) > 0:
+            # Las entradas pendientes de este worker pueden cubrir la venta
+            stock_buffer.flush()
+            final = take_stock(product_id, -delta)
+    except Error as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if final is None:
+        product = get_product_by_id(product_id)
+        if not product:
+            return jsonify({'status': 'error', 'message': 'Producto no encontrado'}), 404
+        return jsonify({'status': 'error', 'message': 'Stock insuficiente',
+                        'cantidad': product['cantidad']}), 409
+    pending = stock_buffer.pending(product_id)
+    return jsonify({'status': 'success', 'id_producto': product_id,
+                    'cantidad': final + pending, 'pendiente': pending})
+
+# ===== Tiendas: stock por sucursal repartido en shards =====
+@stale_reads.fallback
+def get_stores():
+    """Tiendas de la cadena (tabla en la base de datos principal)"""
+    connection = get_mysql_connection(read_only=True)
+    if connection:
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute('SELECT id_tienda, nombre, direccion FROM tiendas ORDER BY nombre')
+            return cursor.fetchall()
+        except Error as e:
+            print(f"Error al obtener tiendas: {e}")
+        finally:
+            cursor.close()
+            connection.close()
+    return []
+
+def get_catalog_prices():
+    """Precio y categoría de cada producto: {id: (precio, categoria)}"""
+    connection = get_mysql_connection(read_only=True)
+    if connection:
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT id, precio, categoria FROM productos')
+            return {row[0]: (float(row[1] or 0), row[2]) for row in cursor.fetchall()}
+        except Error as e:
+            print(f"Error al obtener precios: {e}")
+        finally:
+            cursor.close()
+            connection.close()
+    return {}
+
+def stock_stats(quantities, catalog):
+    """Estadísticas con el mismo formato que get_stats() a partir de {id_producto: cantidad}"""
+    quantities = {pid: qty for pid, qty in quantities.items() if pid in catalog}
+    return {
+        'total_products': len(quantities),
+        'total_units': sum(quantities.values()),
+        'total_value': sum(qty * catalog[pid][0] for pid, qty in quantities.items()),
+        'low_stock': sum(1 for qty in quantities.values() if qty < 10),
+        'categories': len({catalog[pid][1] for pid in quantities})
+    }
+
+@stale_reads.fallback
+def get_store_stats(store_id):
+    """Estadísticas de una sucursal: solo se consulta su shard"""
+    def query(connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT id_producto, cantidad FROM stock_tienda WHERE id_tienda = %s', (store_id,))
+            return dict(cursor.fetchall())
+        finally:
+            cursor.close()
+    
+    results, errors = store_shards.map(query, [store_shards.shard_for(store_id)])
+    stats = stock_stats(next(iter(results.values()), {}), get_catalog_prices())
+    stats['shards_sin_respuesta'] = sorted(errors)
+    return stats
+
+def get_stock_totals(product_ids=None):
+    """Stock total por producto sumando todas las tiendas (consulta en paralelo a cada shard)
+    
+    Devuelve ({id_producto: cantidad}, shards_sin_respuesta).
+    """
+    product_ids = list(product_ids) if product_ids is not None else None
+    def query(connection):
+        cursor = connection.cursor()
+        try:
+            if product_ids is None:
+                cursor.execute('SELECT id_producto, SUM(cantidad) FROM stock_tienda GROUP BY id_producto')
+            else:
+                placeholders = ', '.join(['%s'] * len(product_ids))
+                cursor.execute(f'''
+                    SELECT id_producto, SUM(cantidad) FROM stock_tienda
+                    WHERE id_producto IN ({placeholders}) GROUP BY id_producto
+                ''', product_ids)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    
+    if product_ids == []:
+        return {}, []
+    results, errors = store_shards.map(query)
+    totals = Counter()
+    for rows in results.values():
+        for product_id, quantity in rows:
+            totals[product_id] += int(quantity or 0)
+    return dict(totals), sorted(errors)
+
+@stale_reads.fallback
+def get_chain_stats():
+    """Estadísticas de toda la cadena: stock de todas las tiendas agregado entre shards"""
+    totals, failed = get_stock_totals()
+    stats = stock_stats(totals, get_catalog_prices())
+    stats['shards_sin_respuesta'] = failed
+    return stats
+
+def find_in_stores(product_id):
+    """Tiendas con existencias de un producto (todas los shards en paralelo)"""
+    def query(connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT id_tienda, cantidad FROM stock_tienda WHERE id_producto = %s AND cantidad > 0',
+                           (product_id,))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    
+    results, errors = store_shards.map(query)
+    names = {store['id_tienda']: store['nombre'] for store in get_stores()}
+    found = [
+        {'id_tienda': store_id, 'nombre': names.get(store_id, f'Tienda {store_id}'), 'cantidad': quantity}
+        for rows in results.values() for store_id, quantity in rows
+    ]
+    found.sort(key=lambda item: item['cantidad'], reverse=True)
+    return found, sorted(errors)
+
+def update_store_stock(store_id, product_id, quantity=None, delta=None):
+    """Fija (`quantity`) o ajusta (`delta`) el stock de un producto en una tienda
+    
+    La escritura va solo al shard de la tienda. Devuelve la cantidad final, o
+    None si un ajuste negativo deja la tienda sin unidades suficientes (como
+    take_stock, una sola sentencia condicional: no se vende lo que no hay).
+    """
+    connection = store_shards.get_connection(store_shards.shard_for(store_id))
+    if not connection:
+        raise Error('No se pudo conectar al shard de la tienda')
+    try:
+        cursor = connection.cursor()
+        if quantity is not None:
+            cursor.execute('''
+                INSERT INTO stock_tienda (id_tienda, id_producto, cantidad) VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE cantidad = VALUES(cantidad)
+            ''', (store_id, product_id, quantity))
+        elif delta > 0:
+            cursor.execute('''
+                INSERT INTO stock_tienda (id_tienda, id_producto, cantidad) VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE cantidad = cantidad + VALUES(cantidad)
+            ''', (store_id, product_id, delta))
+        else:
+            cursor.execute('''
+                UPDATE stock_tienda SET cantidad = cantidad - %s
+                WHERE id_tienda = %s AND id_producto = %s AND cantidad >= %s
+            ''', (-delta, store_id, product_id, -delta))
+            if not cursor.rowcount:
+                connection.rollback()
+                return None
+        cursor.execute('SELECT cantidad FROM stock_tienda WHERE id_tienda = %s AND id_producto = %s',
+                       (store_id, product_id))
+        final = cursor.fetchone()[0]
+        connection.commit()
+        if store_shards.shard_for(store_id) == DEFAULT_SHARD:
+            mark_primary_write()
+        return final
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+
+def delete_store_stock(product_id):
+    """Borra el stock de un producto eliminado en todos los shards"""
+    def query(connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('DELETE FROM stock_tienda WHERE id_producto = %s', (product_id,))
+            connection.commit()
+        finally:
+            cursor.close()
+    
+    _, errors = store_shards.map(query, read_only=False)
+    for shard, error in errors.items():
+        print(f"Error al borrar stock del producto {product_id} en {shard}: {error}")
+
+@app.route('/api/tiendas', methods=['GET', 'POST'])
+@login_required
+def api_tiendas():
+    """Lista las tiendas o da de alta una nueva"""
+    if request.method == 'GET':
+        return jsonify({'tiendas': get_stores()})
+    
+    data = request.get_json(silent=True) or request.form
+    nombre = (data.get('nombre') or '').strip()
+    if not nombre:
+        return jsonify({'status': 'error', 'message': 'El nombre de la tienda es obligatorio'}), 400
+    
+    connection = get_mysql_connection()
+    if connection:
+        try:
+            cursor = connection.cursor()
+            cursor.execute('INSERT INTO tiendas (nombre, direccion) VALUES (%s, %s)',
+                           (nombre, (data.get('direccion') or '').strip() or None))
+            store_id = cursor.lastrowid
+            connection.commit()
+            mark_primary_write()
+            return jsonify({'status': 'success', 'id_tienda': store_id,
+                            'shard': store_shards.shard_for(store_id)}), 201
+        except IntegrityError:
+            return jsonify({'status': 'error', 'message': 'Ya existe una tienda con ese nombre'}), 409
+        except Error as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+        finally:
+            cursor.close()
+            connection.close()
+    return jsonify({'status': 'error', 'message': 'Sin conexión a la base de datos'}), 503
+
+@app.route('/api/tiendas/<int:store_id>/stock', methods=['POST'])
+@login_required
+def api_stock_tienda(store_id):
+    """Fija (`cantidad`) o ajusta (`ajuste`) el stock de un producto en una tienda"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        product_id = int(data.get('id_producto'))
+        quantity = int(data['cantidad']) if data.get('cantidad') not in (None, '') else None
+        delta = int(data['ajuste']) if quantity is None and data.get('ajuste') not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'id_producto, cantidad y ajuste deben ser enteros'}), 400
+    if quantity is None and delta is None:
+        return jsonify({'status': 'error', 'message': 'Indica cantidad o ajuste'}), 400
+    if quantity is not None and quantity < 0:
+        return jsonify({'status': 'error', 'message': 'La cantidad no puede ser negativa'}), 400
+    if delta == 0:
+        return jsonify({'status': 'error', 'message': 'El ajuste no puede ser cero'}), 400
+    
+    if not any(store['id_tienda'] == store_id for store in get_stores()):
+        return jsonify({'status': 'error', 'message': 'Tienda no encontrada'}), 404
+    if not get_product_by_id(product_id):
+        return jsonify({'status': 'error', 'message': 'Producto no encontrado'}), 404
+    
+    try:
+        final = update_store_stock(store_id, product_id, quantity=quantity, delta=delta)
+    except Error as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if final is None:
+        return jsonify({'status': 'error', 'message': 'Stock insuficiente en la tienda'}), 409
+    return jsonify({'status': 'success', 'id_tienda': store_id, 'id_producto': product_id, 'cantidad': final})
+
+@app.route('/api/productos/<int:product_id>/disponibilidad')
+@login_required
+def api_disponibilidad(product_id):
+    """Dónde encontrar un producto: existencias por tienda y total de la cadena"""
+    found, failed = find_in_stores(product_id)
+    return jsonify({
+        'id_producto': product_id,
+        'total': sum(item['cantidad'] for item in found),
+        'tiendas': found,
+        'shards_sin_respuesta': failed
+    })
+
+@app.route('/api/stock/total')
+@login_required
+def api_stock_total():
+    """Stock total de la cadena por producto (?ids=1,2,3 para limitar la consulta)"""
+    ids = request.args.get('ids', '').strip()
+    try:
+        product_ids = [int(item) for item in ids.split(',') if item.strip()] if ids else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'ids debe ser una lista de enteros'}), 400
+    totals, failed = get_stock_totals(product_ids)
+    return jsonify({'totales': {str(pid): qty for pid, qty in totals.items()}, 'shards_sin_respuesta': failed})
+
+@app.route('/api/estadisticas')
+@login_required
+def api_estadisticas():
+    """Estadísticas de una sucursal (?tienda=) o de toda la cadena"""
+    tienda = request.args.get('tienda', type=int)
+    stats = get_store_stats(tienda) if tienda else get_chain_stats()
+    return jsonify({'tienda': tienda, 'estadisticas': stats})
+
+# ===== Libros por ISBN =====
+LIBROS_BATCH_MAX = int(os.getenv('LIBROS_BATCH_MAX', '1000'))
+
+# Caché de los ISBN más escaneados en este proceso
+isbn_cache = HotIsbnCache(max_entries=int(os.getenv('ISBN_CACHE_SIZE', '5000')),
+                          ttl=int(os.getenv('ISBN_CACHE_TTL', '30')))
+
+def get_books_by_isbn(isbns):
+    """Resuelve ISBN normalizados a libros (con stock) en una sola consulta
+
+    Devuelve un dict isbn -> libro solo con los ISBN encontrados.
+    """
+    found, missing = isbn_cache.get_many(list(dict.fromkeys(isbns)))
+    if not missing:
+        return found
+    
+    connection = get_mysql_connection(read_only=True)
+    if connection:
+        try:
+            cursor = connection.cursor(dictionary=True)
+            placeholders = ', '.join(['%s'] * len(missing))
+            cursor.execute(f'''
+                SELECT l.id_libro, l.titulo, l.autor, l.isbn, c.nombre_categoria AS categoria,
+                       l.precio, l.stock
+                FROM libros l
+                LEFT JOIN categorias c ON c.id_categoria = l.id_categoria
+                WHERE l.isbn IN ({placeholders})
+            ''', missing)
+            books = {}
+            for book in cursor.fetchall():
+                book['precio'] = float(book['precio']) if book['precio'] is not None else 0
+                books[book['isbn']] = book
+            isbn_cache.put_many(books)
+            found.update(books)
+        except Error as e:
+            print(f"Error al buscar libros por ISBN: {e}")
+        finally:
+            cursor.close()
+            connection.close()
+    return found
+
+def receive_shipment(scanned_isbns):
+    """Suma al stock todos los ISBN escaneados de un envío en una sola transacción"""
+    quantities = {}
+    invalid = []
+    for raw in scanned_isbns:
+        isbn = normalize_isbn(raw)
+        if isbn:
+            quantities[isbn] = quantities.get(isbn, 0) + 1
+        elif str(raw).strip():
+            invalid.append(str(raw).strip())
+    
+    result = {'recibidos': {}, 'desconocidos': [], 'invalidos': invalid, 'unidades': 0}
+    if not quantities:
+        return result
+    
+    connection = get_mysql_connection()
+    if not connection:
+        raise Exception('No se pudo conectar a MySQL')
+    try:
+        cursor = connection.cursor()
+        isbns = list(quantities)
+        placeholders = ', '.join(['%s'] * len(isbns))
+        # Bloquear las filas del envío para que dos cajas no se pisen
+        cursor.execute(f'SELECT isbn FROM libros WHERE isbn IN ({placeholders}) FOR UPDATE', isbns)
+        known = [row[0] for row in cursor.fetchall()]
+        
+        if known:
+            cases = ' '.join(['WHEN %s THEN %s'] * len(known))
+            params = []
+            for isbn in known:
+                params.extend([isbn, quantities[isbn]])
+            cursor.execute(f'''
+                UPDATE libros SET stock = stock + CASE isbn {cases} ELSE 0 END
+                WHERE isbn IN ({', '.join(['%s'] * len(known))})
+            ''', params + known)
+        connection.commit()
+        mark_primary_write()
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+    
+    isbn_cache.invalidate(known)
+    result['recibidos'] = {isbn: quantities[isbn] for isbn in known}
+    result['desconocidos'] = [isbn for isbn in isbns if isbn not in result['recibidos']]
+    result['unidades'] = sum(result['recibidos'].values())
+    return result
+
+def _scanned_isbns_from_request():
+    """Lista de ISBN escaneados desde JSON ({"isbns": [...]}) o un textarea"""
+    if request.is_json:
+        isbns = (request.get_json(silent=True) or {}).get('isbns') or []
+        return isbns if isinstance(isbns, list) else []
+    return request.form.get('isbns', '').split()
+
+@app.route('/libros')
+@login_required
+def libros():
+    """Inventario de libros"""
+    connection = get_mysql_connection(read_only=True)
+    if connection:
+        try:
+            cursor = connection.cursor()
+            cursor.execute('''
+                SELECT l.id_libro, l.titulo, l.autor, l.isbn, c.nombre_categoria,
+                       l.precio, l.stock, l.fecha_ingreso
+                FROM libros l
+                LEFT JOIN categorias c ON c.id_categoria = l.id_categoria
+                ORDER BY l.titulo
+            ''')
+            libros = cursor.fetchall()
+            cursor.execute('SELECT id_categoria, nombre_categoria FROM categorias ORDER BY nombre_categoria')
+            categorias = cursor.fetchall()
+            return render_template('libros.html', libros=libros, categorias=categorias)
+        except Error as e:
+            flash(f'Error al obtener libros: {e}', 'error')
+        finally:
+            cursor.close()
+            connection.close()
+    return render_template('libros.html', libros=[], categorias=[])
+
+@app.route('/libros/agregar', methods=['POST'])
+@login_required
+def agregar_libro():
+    """Agregar un libro al inventario"""
+    try:
+        titulo = request.form['titulo'].strip()
+        autor = request.form['autor'].strip()
+        isbn_raw = request.form.get('isbn', '').strip()
+        id_categoria = request.form.get('categoria') or None
+        precio = float(request.form.get('precio') or 0)
+        stock = int(request.form.get('stock') or 0)
+        
+        if not titulo or not autor:
+            flash('El título y el autor son obligatorios', 'error')
+            return redirect(url_for('libros'))
+        
+        isbn = normalize_isbn(isbn_raw) if isbn_raw else None
+        if isbn_raw and not isbn:
+            flash('El ISBN no es válido', 'error')
+            return redirect(url_for('libros'))
+        
+        if precio < 0 or stock < 0:
+            flash('El precio y el stock no pueden ser negativos', 'error')
+            return redirect(url_for('libros'))
+        
+        connection = get_mysql_connection()
+        if connection:
+            try:
+                cursor = connection.cursor()
+                cursor.execute('''
+                    INSERT INTO libros (titulo, autor, isbn, id_categoria, precio, stock)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                ''', (titulo, autor, isbn, id_categoria, precio, stock))
+                connection.commit()
+                mark_primary_write()
+                flash('Libro agregado exitosamente', 'success')
+            except IntegrityError:
+                flash('Ya existe un libro con ese ISBN', 'error')
+            finally:
+                cursor.close()
+                connection.close()
+    except ValueError:
+        flash('Por favor ingrese valores numéricos válidos', 'error')
+    except Exception as e:
+        flash('Error al agregar el libro: ' + str(e), 'error')
+    
+    return redirect(url_for('libros'))
+
+@app.route('/api/libros/isbn/<isbn>')
+@login_required
+def api_libro_isbn(isbn):
+    """Consulta un libro por ISBN-10 o ISBN-13"""
+    normalized = normalize_isbn(isbn)
+    if not normalized:
+        return jsonify({'status': 'error', 'message': 'ISBN inválido'}), 400
+    book = get_books_by_isbn([normalized]).get(normalized)
+    if not book:
+        return jsonify({'status': 'error', 'message': 'Libro no encontrado', 'isbn': normalized}), 404
+    return jsonify(book)
+
+@app.route('/api/libros/isbn', methods=['POST'])
+@login_required
+def api_libros_isbn_lote():
+    """Resuelve un lote de ISBN escaneados a libros y stock con una sola consulta"""
+    scanned = _scanned_isbns_from_request()
+    if len(scanned) > LIBROS_BATCH_MAX:
+        return jsonify({'status': 'error', 'message': f'Máximo {LIBROS_BATCH_MAX} ISBN por lote'}), 413
+    
+    normalized = [normalize_isbn(raw) for raw in scanned]
+    books = get_books_by_isbn([isbn for isbn in normalized if isbn])
+    resultados = []
+    for raw, isbn in zip(scanned, normalized):
+        item = {'escaneado': raw, 'isbn': isbn, 'libro': books.get(isbn) if isbn else None}
+        if not isbn:
+            item['error'] = 'ISBN inválido'
+        elif not item['libro']:
+            item['error'] = 'No encontrado'
+        resultados.append(item)
+    return jsonify({'resultados': resultados, 'encontrados': sum(1 for r in resultados if r['libro'])})
+
+@app.route('/libros/recepcion', methods=['POST'])
+@login_required
+def recepcion_libros():
+    """Recepción de mercadería: incrementa el stock de todo un envío escaneado"""
+    scanned = _scanned_isbns_from_request()
+    if len(scanned) > LIBROS_BATCH_MAX:
+        message = f'Máximo {LIBROS_BATCH_MAX} ISBN por envío'
+        if request.is_json:
+            return jsonify({'status': 'error', 'message': message}), 413
+        flash(message, 'error')
+        return redirect(url_for('libros'))
+    
+    try:
+        result = receive_shipment(scanned)
+    except Exception as e:
+        if request.is_json:
+            return jsonify({'status': 'error', 'message': f'Error en la recepción: {e}'}), 500
+        flash(f'Error en la recepción: {e}', 'error')
+        return redirect(url_for('libros'))
+    
+    if request.is_json:
+        return jsonify(dict(result, status='success'))
+    
+    flash(f"Recepción registrada: {result['unidades']} unidad(es) de {len(result['recibidos'])} título(s)", 'success')
+    pendientes = result['desconocidos'] + result['invalidos']
+    if pendientes:
+        flash('ISBN no reconocidos: ' + ', '.join(pendientes[:20]), 'warning')
+    return redirect(url_for('libros'))
+
 # [CONTINÚA CON TODAS LAS DEMÁS FUNCIONES... se mantienen igual pero agregando @login_required donde sea necesario]
 
 # Funciones para manejo de archivos (mantener igual pero adaptar para MySQL)
@@ -675,74 +2035,449 @@ def export_to_csv():
                     product_dict['fecha_actualizacion'] = str(product_dict['fecha_actualizacion'])
                 writer.writerow(product_dict)
 
-def import_from_csv(file_path):
-    """Importa productos desde archivo CSV"""
+def export_to_bin():
+    """Exporta el catálogo al snapshot binario que cargan los terminales de venta"""
+    products = get_all_products()
+    ensure_data_directory()
+    write_snapshot(BIN_FILE, products, catalog_version=get_catalog_version())
+
+def export_all_files():
+    """Regenera los archivos TXT, JSON, CSV y el snapshot binario"""
+    export_to_txt()
+    export_to_json()
+    export_to_csv()
+    export_to_bin()
+
+def iter_csv_products(file_path):
+    """Recorre los productos de un archivo CSV sin cargarlo entero en memoria"""
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+def iter_json_products(file_path):
+    """Recorre los productos de un archivo JSON"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for product in data.get('productos', []):
+        yield product
+
+def iter_jsonl_products(file_path):
+    """Recorre los productos de un archivo JSON Lines (un objeto por línea)"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None  # Cuenta como fila fallida
+
+def import_products(rows, progress=None):
+    """Inserta los productos nuevos de `rows` confirmando cada IMPORT_BATCH_SIZE filas
+
+    Devuelve los contadores procesadas/insertadas/omitidas/fallidas. Si se pasa
+    `progress` (un JobProgress) se informa tras cada lote y se detiene cuando
+    el trabajo se cancela; lo ya confirmado se conserva.
+    """
+    counters = {'procesadas': 0, 'insertadas': 0, 'omitidas': 0, 'fallidas': 0}
+    connection = get_mysql_connection()
+    if not connection:
+        raise Exception('No se pudo conectar a MySQL')
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            imported_count = 0
-            
-            connection = get_mysql_connection()
-            if connection:
-                cursor = connection.cursor()
-                for row in reader:
-                    # Verificar si el producto ya existe
-                    if not product_exists_by_name(row['nombre']):
+        cursor = connection.cursor()
+        for row in rows:
+            counters['procesadas'] += 1
+            try:
+                values = validate_product(row)
+            except ValueError:
+                # Sin `continue`: una racha de filas inválidas también guarda el
+                # progreso y comprueba la cancelación
+                counters['fallidas'] += 1
+            else:
+                # Verificar si el producto ya existe (misma conexión: también ve las filas de este archivo)
+                cursor.execute('SELECT id FROM productos WHERE LOWER(nombre) = LOWER(%s)', (values[0],))
+                if cursor.fetchone():
+                    counters['omitidas'] += 1
+                else:
+                    try:
                         cursor.execute('''
                             INSERT INTO productos (nombre, descripcion, cantidad, precio, categoria)
                             VALUES (%s, %s, %s, %s, %s)
-                        ''', (
-                            row['nombre'],
-                            row['descripcion'],
-                            int(row['cantidad']),
-                            float(row['precio']),
-                            row['categoria']
-                        ))
-                        imported_count += 1
-                
+                        ''', values)
+                        counters['insertadas'] += 1
+                    except IntegrityError:
+                        counters['omitidas'] += 1
+            
+            if counters['procesadas'] % IMPORT_BATCH_SIZE == 0:
+                if counters['insertadas']:
+                    # Las sugerencias se publican al final: no reconstruir en cada lote
+                    bump_catalog_version(cursor, suggestions=False)
+                connection.commit()
+                if progress and not progress.update(counters):
+                    break
+        
+        if counters['insertadas']:
+            bump_catalog_version(cursor)
+        connection.commit()
+        mark_primary_write()
+        if counters['insertadas']:
+            suggestion_index.invalidate()
+        return counters
+    finally:
+        cursor.close()
+        connection.close()
+
+def import_products_parallel(file_path, formato, progress=None):
+    """Importa un CSV o JSON Lines grande validando en paralelo con un pool de procesos
+    
+    El archivo se parte en trozos alineados a líneas que se validan en
+    IMPORT_PROCESSES procesos; los resultados llegan en el orden del archivo y
+    se insertan por lotes con ON DUPLICATE KEY UPDATE (el índice único de nombre
+    descarta los duplicados). Devuelve los mismos contadores que import_products más un
+    mensaje con el rendimiento.
+    """
+    counters = {'procesadas': 0, 'insertadas': 0, 'omitidas': 0, 'fallidas': 0}
+    started = time.monotonic()
+    bytes_read = 0
+    connection = get_mysql_connection()
+    if not connection:
+        raise Exception('No se pudo conectar a MySQL')
+    try:
+        cursor = connection.cursor()
+        chunks = iter_parsed_chunks(file_path, formato, IMPORT_PROCESSES, IMPORT_CHUNK_BYTES)
+        for rows, processed, failed, size in chunks:
+            for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+                batch = rows[start:start + IMPORT_BATCH_SIZE]
+                # Solo se saltan los duplicados: INSERT IGNORE también convertiría
+                # los errores de datos en avisos y guardaría valores recortados
+                cursor.executemany('''
+                    INSERT INTO productos (nombre, descripcion, cantidad, precio, categoria)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE id = id
+                ''', batch)
+                inserted = max(cursor.rowcount, 0)
+                counters['insertadas'] += inserted
+                counters['omitidas'] += len(batch) - inserted
+                if inserted:
+                    bump_catalog_version(cursor, suggestions=False)
                 connection.commit()
-                cursor.close()
-                connection.close()
             
-            return imported_count
+            counters['procesadas'] += processed
+            counters['fallidas'] += failed
+            bytes_read += size
+            elapsed = max(time.monotonic() - started, 1e-6)
+            counters['mensaje'] = (f"{counters['procesadas'] / elapsed:,.0f} filas/s, "
+                                   f"{bytes_read / elapsed / 1024 / 1024:.1f} MB/s con {IMPORT_PROCESSES} procesos")
+            if progress and not progress.update(counters):
+                chunks.close()
+                break
+        
+        if counters['insertadas']:
+            bump_catalog_version(cursor)
+            connection.commit()
+        mark_primary_write()
+        if counters['insertadas']:
+            suggestion_index.invalidate()
+        print(f"📥 Importación paralela de {file_path}: {counters['procesadas']} filas "
+              f"en {time.monotonic() - started:.1f}s ({counters.get('mensaje', '')})")
+        return counters
+    finally:
+        cursor.close()
+        connection.close()
+
+def import_from_csv(file_path):
+    """Importa productos desde archivo CSV"""
+    try:
+        return import_products(iter_csv_products(file_path))['insertadas']
     except Exception as e:
         raise Exception("Error al importar CSV: " + str(e))
 
 def import_from_json(file_path):
     """Importa productos desde archivo JSON"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            imported_count = 0
-            
-            connection = get_mysql_connection()
-            if connection:
-                cursor = connection.cursor()
-                for product in data.get('productos', []):
-                    # Verificar si el producto ya existe
-                    if not product_exists_by_name(product['nombre']):
-                        cursor.execute('''
-                            INSERT INTO productos (nombre, descripcion, cantidad, precio, categoria)
-                            VALUES (%s, %s, %s, %s, %s)
-                        ''', (
-                            product['nombre'],
-                            product.get('descripcion', ''),
-                            int(product['cantidad']),
-                            float(product['precio']),
-                            product['categoria']
-                        ))
-                        imported_count += 1
-                
-                connection.commit()
-                cursor.close()
-                connection.close()
-            
-            return imported_count
+        return import_products(iter_json_products(file_path))['insertadas']
     except Exception as e:
         raise Exception("Error al importar JSON: " + str(e))
 
+def run_import_job(tipo, file_path, progress):
+    """Tarea de fondo: importa el archivo y regenera las exportaciones una sola vez
+    
+    Los CSV y JSON Lines grandes se validan en paralelo; el resto, fila a fila.
+    """
+    try:
+        if tipo in FORMATOS_PARALELOS and os.path.getsize(file_path) >= IMPORT_PARALLEL_MIN_BYTES:
+            counters = import_products_parallel(file_path, tipo, progress)
+        else:
+            readers = {'csv': iter_csv_products, 'json': iter_json_products, 'jsonl': iter_jsonl_products}
+            counters = import_products(readers[tipo](file_path), progress)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    if counters['insertadas']:
+        export_all_files()
+    return counters
+
+def import_file_path(job_id, tipo):
+    """Archivo subido de un trabajo de importación"""
+    return os.path.join(IMPORT_DIR, f'{job_id}.{tipo}')
+
+def remove_import_file(job):
+    """Borra el archivo de un trabajo que quedó interrumpido"""
+    file_path = import_file_path(job['id'], job['tipo'])
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+# Importación en segundo plano
+import_jobs = JobRunner(get_mysql_connection, max_workers=IMPORT_WORKERS, on_interrupted=remove_import_file)
+
+def reclaim_orphans():
+    """Recoge lo que dejaron los workers que murieron: importaciones y diarios de stock (en cada worker nuevo)
+    
+    Se ejecuta en un hilo para no retrasar el arranque del worker si MySQL tarda.
+    """
+    def run():
+        try:
+            jobs = import_jobs.reclaim_orphans()
+            if jobs:
+                print(f"{len(jobs)} trabajos de importación de workers terminados marcados como interrumpidos")
+        except Error as e:
+            print(f"Error al recuperar trabajos huérfanos: {e}")
+        recover_stock_journal()
+    threading.Thread(target=run, name='huerfanos', daemon=True).start()
+
+@app.route('/datos/importar', methods=['POST'])
+@login_required
+def importar_datos():
+    """Recibe un archivo y encola su importación; responde con el id del trabajo"""
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        return jsonify({'status': 'error', 'message': 'Selecciona un archivo para importar'}), 400
+    
+    tipo = archivo.filename.rsplit('.', 1)[-1].lower() if '.' in archivo.filename else ''
+    if tipo == 'ndjson':
+        tipo = 'jsonl'
+    if tipo not in ('csv', 'json', 'jsonl'):
+        return jsonify({'status': 'error', 'message': 'Formato no soportado (usa CSV, JSON o JSON Lines)'}), 400
+    
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    file_path = import_file_path(job_id, tipo)
+    archivo.save(file_path)
+    
+    try:
+        import_jobs.submit(tipo, archivo.filename, lambda progress: run_import_job(tipo, file_path, progress),
+                           job_id=job_id)
+    except Error as e:
+        os.remove(file_path)
+        return jsonify({'status': 'error', 'message': f'Error al crear el trabajo: {e}'}), 500
+    
+    return jsonify({
+        'status': 'success',
+        'id': job_id,
+        'estado': 'pendiente',
+        'url_estado': url_for('estado_importacion', job_id=job_id),
+        'url_cancelar': url_for('cancelar_importacion', job_id=job_id)
+    }), 202
+
+@app.route('/datos/importar/<job_id>')
+@login_required
+def estado_importacion(job_id):
+    """Progreso de un trabajo de importación"""
+    try:
+        job = import_jobs.get(job_id)
+    except Error as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Trabajo no encontrado'}), 404
+    return jsonify(job)
+
+@app.route('/datos/importar/<job_id>/cancelar', methods=['POST'])
+@login_required
+def cancelar_importacion(job_id):
+    """Cancela un trabajo de importación pendiente o en curso"""
+    try:
+        cancelled = import_jobs.cancel(job_id)
+    except Error as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if not cancelled:
+        return jsonify({'status': 'error', 'message': 'El trabajo ya terminó o no existe'}), 409
+    return jsonify({'status': 'success', 'id': job_id})
+
+# ===== Perfiles de peticiones =====
+@app.route('/admin/perfiles')
+@login_required
+def perfiles():
+    """Lista los perfiles guardados y entrega un token para la cabecera X-Perfil"""
+    return jsonify({
+        'perfiles': [
+            dict(p, url=url_for('descargar_perfil', nombre=p['nombre']),
+                 fecha=datetime.fromtimestamp(p['fecha']).strftime('%Y-%m-%d %H:%M:%S'))
+            for p in profiler.list_profiles()
+        ],
+        'combinado': url_for('perfil_combinado'),
+        'muestreo': profiler.sample_rate,
+        'cabecera': RequestProfiler.HEADER,
+        'token': profiler.make_token(),
+        'token_expira_en': profiler.token_max_age
+    })
+
+@app.route('/admin/perfiles/combinado')
+@login_required
+def perfil_combinado():
+    """Todos los perfiles sumados en un archivo de pilas colapsadas"""
+    response = make_response(profiler.merged())
+    response.mimetype = 'text/plain'
+    response.headers['Content-Disposition'] = 'attachment; filename=perfiles.folded'
+    return response
+
+@app.route('/admin/perfiles/<nombre>')
+@login_required
+def descargar_perfil(nombre):
+    """Descarga un perfil (pilas colapsadas para flamegraph.pl o speedscope)"""
+    if not nombre.endswith('.folded'):
+        abort(404)
+    return send_from_directory(os.path.abspath(PROFILE_DIR), nombre, mimetype='text/plain', as_attachment=True)
+
+# ===== Modo asíncrono: consultas independientes en paralelo =====
+async def async_fetch(sql, params=(), dictionary=True, one=False):
+    """Consulta de lectura por el pool aiomysql, con el mismo circuito que las conexiones síncronas
+    
+    Las réplicas caídas las aparta AsyncDatabase: un error de conexión que
+    llega aquí es del primario.
+    """
+    db_breaker.before_call()
+    try:
+        result = await async_db.fetch(sql, params, dictionary=dictionary, one=one,
+                                      use_replica=not reads_use_primary())
+    except Error as e:
+        if e.errno in CONNECTION_ERRNOS:
+            db_breaker.record_failure()
+            raise ServicioNoDisponible('No se pudo conectar a la base de datos',
+                                       retry_after=db_breaker.reset_timeout) from e
+        # Error de la consulta: el servidor respondió
+        db_breaker.record_success()
+        raise
+    except BaseException:
+        # Cancelada (p. ej. otra consulta del gather falló): sin resultado que informar
+        db_breaker.abandon_probe()
+        raise
+    db_breaker.record_success()
+    return result
+
+def run_blocking(func, *args):
+    """Ejecuta un helper síncrono en un hilo sin bloquear el bucle de la vista
+    
+    El hilo recibe una copia del contexto de la petición (como asyncio.to_thread):
+    sus conexiones comparten el hueco de admisión que la vista ya tiene reservado.
+    """
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(None, partial(context.run, func, *args))
+
+async def gather_admitted(*factories):
+    """asyncio.gather de `factory()` para cada una, dentro del hueco de admisión de la petición
+    
+    Las consultas de aiomysql no pasan por get_mysql_connection: sin esto
+    quedarían fuera del límite DB_MAX_INFLIGHT. Se reciben funciones y no
+    corrutinas para no lanzar nada si la admisión rechaza la petición.
+    """
+    _acquire_request_slot()
+    try:
+        return await asyncio.gather(*(factory() for factory in factories))
+    finally:
+        _release_request_slot()
+
+async def get_all_products_async():
+    """Versión async de get_all_products"""
+    return stock_buffer.merge(await async_fetch('SELECT * FROM productos ORDER BY id DESC'))
+
+async def get_recent_products_async(limit=5):
+    """Últimos productos creados (solo trae las filas que se muestran)"""
+    return stock_buffer.merge(await async_fetch('SELECT * FROM productos ORDER BY id DESC LIMIT %s', (limit,)))
+
+async def get_categories_async():
+    """Versión async de get_categories"""
+    rows = await async_fetch('''
+        SELECT DISTINCT categoria FROM productos 
+        WHERE categoria IS NOT NULL AND categoria != ''
+        ORDER BY categoria
+    ''', dictionary=False)
+    return [row[0] for row in rows]
+
+async def get_stats_async():
+    """Versión async de get_stats: las cuatro consultas a la vez"""
+    total_products, total_value, low_stock, categories_count = await asyncio.gather(
+        async_fetch('SELECT COUNT(*) FROM productos', dictionary=False, one=True),
+        async_fetch('SELECT SUM(cantidad * precio) FROM productos', dictionary=False, one=True),
+        async_fetch('SELECT COUNT(*) FROM productos WHERE cantidad < 10', dictionary=False, one=True),
+        async_fetch('SELECT COUNT(DISTINCT categoria) FROM productos', dictionary=False, one=True)
+    )
+    return {
+        'total_products': total_products[0] or 0,
+        'total_value': float(total_value[0]) if total_value[0] else 0,
+        'low_stock': low_stock[0] or 0,
+        'categories': categories_count[0] or 0
+    }
+
+async def inventario_async():
+    """/inventario con productos y categorías en paralelo"""
+    try:
+        products, categories = await gather_admitted(get_all_products_async, get_categories_async)
+    except (ServicioNoDisponible, Error):
+        # El camino síncrono aplica admisión y sirve la última copia buena
+        return inspect.unwrap(inventario)()
+    return render_template('inventario.html', products=products, categories=categories)
+
+async def dashboard_async():
+    """/dashboard con todas sus consultas en paralelo (las de tiendas, en hilos)"""
+    tienda = request.args.get('tienda', type=int)
+    try:
+        if tienda:
+            stats, recent_products, tiendas = await gather_admitted(
+                partial(run_blocking, get_store_stats, tienda), get_recent_products_async,
+                partial(run_blocking, get_stores))
+            chain_stats = None
+        else:
+            stats, chain_stats, recent_products, tiendas = await gather_admitted(
+                get_stats_async, partial(run_blocking, get_chain_stats), get_recent_products_async,
+                partial(run_blocking, get_stores))
+    except (ServicioNoDisponible, Error):
+        return inspect.unwrap(dashboard)()
+    return render_template('dashboard.html', stats=stats, recent_products=recent_products,
+                           chain_stats=chain_stats, tiendas=tiendas, tienda_actual=tienda)
+
+if ASYNC_DB:
+    if async_db.available:
+        # Mismas URLs y decoradores; solo cambia la función que atiende la ruta
+        app.view_functions['inventario'] = login_required(conditional_page(inventario_async))
+        app.view_functions['dashboard'] = login_required(dashboard_async)
+    else:
+        print("⚠️  ASYNC_DB activado pero aiomysql no está instalado: se usan las rutas síncronas")
+
 # [TODAS LAS DEMÁS RUTAS SE MANTIENEN IGUAL, solo agregando @login_required donde corresponda]
 
+# Caché de fragmentos renderizados (filas del inventario y cuerpo del detalle)
+fragment_cache = FragmentCache(max_entries=int(os.getenv('FRAGMENT_CACHE_SIZE', '5000')))
+
+# Campos que muestran los fragmentos de producto (templates/partials)
+FRAGMENT_FIELDS = ('nombre', 'descripcion', 'cantidad', 'precio', 'categoria',
+                   'fecha_creacion', 'fecha_actualizacion')
+
+def fragment_version(product):
+    """Huella de los campos que se renderizan
+    
+    fecha_actualizacion sola no basta: tiene resolución de un segundo y no
+    cambia con los ajustes de stock pendientes de este worker.
+    """
+    values = '\x1f'.join(str(product.get(field)) for field in FRAGMENT_FIELDS)
+    return hashlib.sha1(values.encode()).hexdigest()[:16]
+
+@app.template_global()
+def cached_fragment(name, product):
+    """Renderiza templates/partials/<name>.html para un producto, reutilizando el HTML si no cambió"""
+    return Markup(fragment_cache.get_or_render(
+        name, product['id'], fragment_version(product),
+        lambda: render_template(f'partials/{name}.html', product=product)
+    ))
+
 # Filtros personalizados para Jinja2
 @app.template_filter('currency')
 def currency_filter(amount):
@@ -772,6 +2507,19 @@ def not_found_error(error):
 def internal_error(error):
     return render_template('500.html'), 500
 
+@app.errorhandler(ServicioNoDisponible)
+def service_unavailable(error):
+    """MySQL saturado o caído: 503 con Retry-After en lugar de páginas vacías"""
+    if request.path.startswith('/api/') or not request.accept_mimetypes.accept_html:
+        response = jsonify({'error': str(error), 'reintentar_en': error.retry_after})
+    else:
+        # Sin render_template: sus procesadores de contexto cargan el usuario
+        # (Flask-Login), que volvería a pedir MySQL y acabaría en un 500
+        response = make_response(app.jinja_env.get_template('503.html').render(error=error))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 if __name__ == '__main__':
     # Crear directorios necesarios
     ensure_data_directory()
@@ -781,9 +2529,7 @@ if __name__ == '__main__':
     
     # Crear archivos de datos iniciales si no existen
     if get_all_products():
-        export_to_txt()
-        export_to_json()
-        export_to_csv()
+        export_all_files()
     
     # Ejecutar aplicación
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
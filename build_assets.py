@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Script para preparar los archivos estáticos de producción
+Ejecutar: python build_assets.py
+
+Minifica script.js y style.css, agrega un hash del contenido al nombre
+(script.3f2a9c1d.js) y genera las variantes precomprimidas .gz y .br en
+static/dist/, junto con un manifest.json que usa la aplicación para
+emitir las URLs con huella.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+from compresion import brotli, compress
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_FILE = os.path.join(DIST_DIR, 'manifest.json')
+HISTORY_FILE = os.path.join(DIST_DIR, 'historial.json')
+
+# Builds cuyos archivos se conservan: en un despliegue con USR2 los workers
+# viejos siguen sirviendo páginas con las huellas anteriores hasta el QUIT
+KEEP_BUILDS = 3
+
+# Archivos que se procesan
+ASSETS = ['script.js', 'style.css']
+
+
+def minify_css(source):
+    """Minificación conservadora de CSS: comentarios y espacios sobrantes"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    source = source.replace(';}', '}')
+    return source.strip()
+
+
+def minify_js(source):
+    """Minificación conservadora de JS: comentarios de línea, sangría y líneas vacías
+
+    No se reescribe código: cada sentencia queda en su propia línea, así que
+    la inserción automática de punto y coma se comporta igual que antes.
+    """
+    lines = []
+    for line in source.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+
+def build_asset(filename):
+    """Procesa un archivo y devuelve el nombre con huella"""
+    name, extension = os.path.splitext(filename)
+    with open(os.path.join(STATIC_DIR, filename), 'r', encoding='utf-8') as f:
+        content = MINIFIERS[extension](f.read()).encode('utf-8')
+
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    fingerprinted = f'{name}.{digest}{extension}'
+    target = os.path.join(DIST_DIR, fingerprinted)
+
+    with open(target, 'wb') as f:
+        f.write(content)
+    with open(target + '.gz', 'wb') as f:
+        f.write(compress(content, 'gzip', level=9))
+    if brotli:
+        with open(target + '.br', 'wb') as f:
+            f.write(compress(content, 'br', level=11))
+
+    print(f"✅ {filename} -> dist/{fingerprinted} ({len(content):,} bytes)")
+    return fingerprinted
+
+
+def load_history():
+    """Huellas de los últimos builds, del más reciente al más antiguo"""
+    try:
+        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def write_json(path, data):
+    """Escribe un JSON de forma atómica: los workers nunca leen uno a medias"""
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp, path)
+
+
+def build():
+    """Genera todos los archivos y el manifest; borra los de builds más antiguos que KEEP_BUILDS"""
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest = {filename: build_asset(filename) for filename in ASSETS}
+
+    current = sorted(manifest.values())
+    history = [current] + [files for files in load_history() if files != current]
+    history = history[:KEEP_BUILDS]
+    kept = {name for files in history for name in files}
+    for existing in os.listdir(DIST_DIR):
+        base = existing[:-3] if existing.endswith(('.gz', '.br')) else existing
+        if existing not in ('manifest.json', 'historial.json') and base not in kept:
+            os.remove(os.path.join(DIST_DIR, existing))
+
+    write_json(HISTORY_FILE, history)
+    write_json(MANIFEST_FILE, manifest)
+    return manifest
+
+
+def main():
+    """Función principal"""
+    print("🚀 Preparando archivos estáticos...")
+    build()
+    if not brotli:
+        print("⚠️  brotli no está instalado: solo se generan variantes .gz")
+    print(f"📄 Manifest guardado en: {MANIFEST_FILE}")
+
+
+if __name__ == "__main__":
+    main()
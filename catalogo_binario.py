@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Snapshot binario del catálogo (datos/datos.bin)
+
+Formato de ancho fijo pensado para que los terminales de punto de venta
+arranquen al instante: el archivo se abre con mmap y cada producto se lee
+por id en O(1) sin analizar el resto. Solo usa la biblioteca estándar,
+así que este archivo se puede copiar tal cual al terminal.
+
+Ejecutar: python catalogo_binario.py datos/datos.bin [id ...]
+
+Estructura (little-endian, bloques alineados a 8 bytes):
+
+    cabecera     128 bytes (ver HEADER; el resto queda reservado)
+    ids          n x int32
+    cantidades   n x int32
+    precios      n x int64, en céntimos
+    nombres      n x (uint32 desplazamiento, uint32 longitud) en la tabla de textos
+    categorias   n x (uint32 desplazamiento, uint32 longitud) en la tabla de textos
+    textos       UTF-8 concatenado (las cadenas repetidas se guardan una vez)
+    indice       tabla hash id -> fila: slots x (int32 id, uint32 fila + 1), 0 = vacío
+"""
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from decimal import Decimal, ROUND_HALF_UP
+
+MAGIC = b'INVCAT\x00\x00'
+FORMAT_VERSION = 1
+
+# magic, versión, tamaño de cabecera, productos, slots del índice, fecha de
+# creación, versión del catálogo, crc32 del cuerpo, desplazamientos de los 7 bloques
+HEADER = struct.Struct('<8sHHIIqqI4x7Q')
+HEADER_SIZE = 128
+
+ROW_ID = struct.Struct('<i')
+ROW_CANTIDAD = struct.Struct('<i')
+ROW_PRECIO = struct.Struct('<q')
+ROW_TEXTO = struct.Struct('<II')
+INDEX_SLOT = struct.Struct('<iI')
+
+
+class SnapshotError(ValueError):
+    """El archivo no es un snapshot válido o su versión no está soportada"""
+
+
+def _slot(product_id, mask):
+    """Posición inicial de un id en el índice (hash multiplicativo de Knuth)"""
+    return ((product_id & 0xFFFFFFFF) * 2654435761 & 0xFFFFFFFF) & mask
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def _cents(precio):
+    """Precio (Decimal, float o texto) a céntimos exactos"""
+    return int((Decimal(str(precio or 0)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def write_snapshot(path, products, catalog_version=0):
+    """Escribe el snapshot de `products` (dicts con id, nombre, cantidad, precio, categoria)
+
+    Se escribe en un archivo temporal y se reemplaza de forma atómica: un
+    terminal que tenga mapeada la versión anterior no ve un archivo a medias.
+    """
+    count = len(products)
+    slots = 8
+    while slots < count * 2:
+        slots *= 2
+    mask = slots - 1
+
+    ids = bytearray(ROW_ID.size * count)
+    cantidades = bytearray(ROW_CANTIDAD.size * count)
+    precios = bytearray(ROW_PRECIO.size * count)
+    nombres = bytearray(ROW_TEXTO.size * count)
+    categorias = bytearray(ROW_TEXTO.size * count)
+    textos = bytearray()
+    interned = {}
+    index = bytearray(INDEX_SLOT.size * slots)
+
+    def intern(text):
+        data = (text or '').encode('utf-8')
+        ref = interned.get(data)
+        if ref is None:
+            ref = interned[data] = (len(textos), len(data))
+            textos.extend(data)
+        return ref
+
+    for row, product in enumerate(products):
+        product_id = int(product['id'])
+        ROW_ID.pack_into(ids, row * ROW_ID.size, product_id)
+        ROW_CANTIDAD.pack_into(cantidades, row * ROW_CANTIDAD.size, int(product['cantidad']))
+        ROW_PRECIO.pack_into(precios, row * ROW_PRECIO.size, _cents(product['precio']))
+        ROW_TEXTO.pack_into(nombres, row * ROW_TEXTO.size, *intern(product['nombre']))
+        ROW_TEXTO.pack_into(categorias, row * ROW_TEXTO.size, *intern(product['categoria']))
+
+        slot = _slot(product_id, mask)
+        while INDEX_SLOT.unpack_from(index, slot * INDEX_SLOT.size)[1]:
+            slot = (slot + 1) & mask  # Sondeo lineal
+        INDEX_SLOT.pack_into(index, slot * INDEX_SLOT.size, product_id, row + 1)
+
+    blocks = [ids, cantidades, precios, nombres, categorias, textos, index]
+    offsets = []
+    body = bytearray()
+    for block in blocks:
+        offsets.append(HEADER_SIZE + len(body))
+        body.extend(block)
+        body.extend(b'\x00' * (_align(len(body)) - len(body)))
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, HEADER_SIZE, count, slots, int(time.time()),
+                         int(catalog_version or 0), zlib.crc32(body), *offsets)
+
+    # Un temporal propio por escritura: dos exportaciones simultáneas no se pisan
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header.ljust(HEADER_SIZE, b'\x00'))
+            f.write(body)
+        os.chmod(tmp_path, 0o644)  # mkstemp crea el archivo con permisos 0600
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return HEADER_SIZE + len(body)
+
+
+class CatalogSnapshot:
+    """Lector del snapshot: mapea el archivo y consulta productos sin cargarlo
+
+    `get(id)` usa el índice hash (O(1)); iterar recorre las filas en el orden
+    de exportación. Con `verify=True` se comprueba el crc32 del cuerpo (lee
+    todo el archivo una vez).
+    """
+
+    def __init__(self, path, verify=False):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Archivo vacío
+            self._file.close()
+            raise SnapshotError(f'{path}: archivo vacío')
+
+        if len(self._mm) < HEADER_SIZE:
+            self.close()
+            raise SnapshotError(f'{path}: cabecera incompleta')
+        (magic, version, header_size, self.count, self._slots, self.created_at,
+         self.catalog_version, crc, *offsets) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise SnapshotError(f'{path}: no es un snapshot del catálogo')
+        if version != FORMAT_VERSION:
+            self.close()
+            raise SnapshotError(f'{path}: versión {version} no soportada (se espera {FORMAT_VERSION})')
+        if verify and zlib.crc32(self._mm[header_size:]) != crc:
+            self.close()
+            raise SnapshotError(f'{path}: crc32 incorrecto, archivo dañado')
+
+        self.version = version
+        (self._ids, self._cantidades, self._precios, self._nombres,
+         self._categorias, self._textos, self._index) = offsets
+        self._mask = self._slots - 1
+
+    def close(self):
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _text(self, block, row):
+        offset, length = ROW_TEXTO.unpack_from(self._mm, block + row * ROW_TEXTO.size)
+        start = self._textos + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def row(self, row):
+        """Producto de la fila `row` (0 <= row < len)"""
+        return {
+            'id': ROW_ID.unpack_from(self._mm, self._ids + row * ROW_ID.size)[0],
+            'nombre': self._text(self._nombres, row),
+            'cantidad': ROW_CANTIDAD.unpack_from(self._mm, self._cantidades + row * ROW_CANTIDAD.size)[0],
+            'precio': Decimal(ROW_PRECIO.unpack_from(self._mm, self._precios + row * ROW_PRECIO.size)[0]) / 100,
+            'categoria': self._text(self._categorias, row),
+        }
+
+    def find_row(self, product_id):
+        """Fila de un id en el índice, o None si no está"""
+        slot = _slot(product_id, self._mask)
+        for _ in range(self._slots):
+            stored_id, row = INDEX_SLOT.unpack_from(self._mm, self._index + slot * INDEX_SLOT.size)
+            if not row:
+                return None
+            if stored_id == product_id:
+                return row - 1
+            slot = (slot + 1) & self._mask
+        return None
+
+    def get(self, product_id, default=None):
+        """Producto por id sin recorrer el archivo"""
+        row = self.find_row(int(product_id))
+        return default if row is None else self.row(row)
+
+    def __contains__(self, product_id):
+        return self.find_row(int(product_id)) is not None
+
+    def __iter__(self):
+        for row in range(self.count):
+            yield self.row(row)
+
+
+def main():
+    """Muestra la cabecera del snapshot y, si se indican, los productos pedidos"""
+    if len(sys.argv) < 2:
+        print("Uso: python catalogo_binario.py datos/datos.bin [id ...]")
+        return
+    with CatalogSnapshot(sys.argv[1], verify=True) as snapshot:
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.created_at))
+        print(f"📦 {snapshot.path}: {len(snapshot)} productos, formato v{snapshot.version}, "
+              f"catálogo v{snapshot.catalog_version}, creado {created}")
+        for product_id in sys.argv[2:]:
+            product = snapshot.get(int(product_id))
+            print(f"  {product_id}: {product if product else 'no encontrado'}")
+
+
+if __name__ == "__main__":
+    main()
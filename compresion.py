@@ -0,0 +1,52 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se sirve solo gzip
+    brotli = None
+
+# Tipos de contenido que vale la pena comprimir
+COMPRESSIBLE_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+}
+
+
+def supported_encodings():
+    """Codificaciones disponibles, de la preferida a la menos preferida"""
+    return ['br', 'gzip'] if brotli else ['gzip']
+
+
+def compress(data, encoding, level=None):
+    """Comprime bytes con la codificación indicada"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=5 if level is None else level)
+    return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+
+
+def compress_response(response, accept_encodings, min_size=1024):
+    """Comprime la respuesta si el cliente lo acepta y supera el tamaño mínimo"""
+    if (response.status_code < 200 or response.status_code >= 300
+            or response.status_code == 204
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = accept_encodings.best_match(supported_encodings())
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,158 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+class ServicioNoDisponible(Exception):
+    """La base de datos no puede atender la petición ahora (saturada o caída)"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class AdmissionControl:
+    """Limita el trabajo simultáneo contra MySQL dentro de un proceso
+
+    Como máximo `max_inflight` operaciones a la vez; el resto espera hasta
+    `queue_timeout` segundos y, si no hay hueco, se rechaza con
+    ServicioNoDisponible para no acumular peticiones que ya van tarde.
+    """
+
+    def __init__(self, max_inflight=5, queue_timeout=1.0):
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def acquire(self):
+        """Reserva un hueco o lanza ServicioNoDisponible tras la espera máxima"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ServicioNoDisponible('Demasiadas operaciones de base de datos en curso',
+                                       retry_after=self.queue_timeout + 1)
+
+    def release(self):
+        """Libera un hueco reservado con acquire()"""
+        self._slots.release()
+
+
+class CircuitBreaker:
+    """Corta el acceso a MySQL tras varios fallos de conexión seguidos
+
+    Con el circuito abierto se rechaza al instante durante `reset_timeout`
+    segundos; después se deja pasar una sola conexión de prueba (semiabierto)
+    que lo vuelve a cerrar si funciona o lo reabre si falla.
+    """
+
+    CERRADO = 'cerrado'
+    ABIERTO = 'abierto'
+    SEMIABIERTO = 'semiabierto'
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return self.CERRADO
+            if self._probing or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.SEMIABIERTO
+            return self.ABIERTO
+
+    def before_call(self):
+        """Lanza ServicioNoDisponible si el circuito no deja pasar esta conexión"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._probing:
+                raise ServicioNoDisponible('La base de datos no responde', retry_after=max(remaining, 1))
+            self._probing = True  # Esta es la conexión de prueba
+
+    def abandon_probe(self):
+        """La conexión de prueba no llegó a usarse: se deja pasar otra"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                print("✅ Conexión a MySQL recuperada: circuito cerrado")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                print(f"⚠️  {self._failures} fallos de conexión a MySQL: circuito abierto {self.reset_timeout:g}s")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class AdmittedConnection:
+    """Conexión que devuelve su hueco de admisión al cerrarse"""
+
+    def __init__(self, connection, on_close):
+        self._connection = connection
+        self._on_close = on_close
+
+    def close(self):
+        try:
+            self._connection.close()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close:
+                on_close()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class StaleCache:
+    """Último resultado correcto de cada lectura, para servirlo si MySQL no está disponible
+
+    `fallback` decora una función de lectura: guarda lo que devuelve y, si
+    lanza ServicioNoDisponible, devuelve el último valor guardado para los
+    mismos argumentos (y llama a `on_stale`). Si no hay ninguno, relanza.
+    """
+
+    def __init__(self, max_entries=512, on_stale=None):
+        self.max_entries = max_entries
+        self.on_stale = on_stale
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def fallback(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            try:
+                result = func(*args, **kwargs)
+            except ServicioNoDisponible:
+                with self._lock:
+                    if key not in self._entries:
+                        raise
+                    result = self._entries[key]
+                if self.on_stale:
+                    self.on_stale(func.__name__)
+                return result
+            with self._lock:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return result
+        return wrapper
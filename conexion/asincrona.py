@@ -0,0 +1,129 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+
+from mysql.connector import Error
+
+try:
+    import aiomysql
+except ImportError:  # aiomysql es opcional: sin él no hay modo asíncrono
+    aiomysql = None
+
+# Errores de conexión de MySQL (no de la consulta): servidor caído o conexión perdida
+CONNECTION_ERRNOS = (2003, 2005, 2006, 2013)
+
+
+class AsyncDatabase:
+    """Pools de aiomysql en un bucle de eventos propio (un hilo por proceso)
+
+    Flask ejecuta cada vista async en su propio bucle, que muere al terminar
+    la petición, así que los pools no pueden vivir ahí: las consultas se
+    envían a este bucle con run_coroutine_threadsafe y la vista las espera
+    con asyncio.wrap_future. Varias consultas lanzadas con asyncio.gather
+    van en paralelo, cada una por su conexión del pool.
+
+    Como DatabaseRouter, una réplica que no responde queda fuera de la
+    rotación un tiempo y la lectura se repite en el primario: solo los
+    errores de conexión del primario llegan al llamador.
+    """
+
+    # Segundos que una réplica caída queda fuera de la rotación
+    REPLICA_RETRY_SECONDS = 10
+
+    def __init__(self, primary_config, replica_hosts=None, pool_size=10):
+        self.configs = {'primario': dict(primary_config)}
+        for index, (host, port) in enumerate(replica_hosts or []):
+            self.configs[f'replica{index}'] = dict(primary_config, host=host, port=port)
+        self.pool_size = pool_size
+        self._replicas = [name for name in self.configs if name != 'primario']
+        self._next_replica = itertools.count()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._pools = {}
+        self._replica_down_until = {}
+
+    @property
+    def available(self):
+        return aiomysql is not None
+
+    def reset(self):
+        """Olvida el bucle y los pools (tras el fork de cada worker se crean de nuevo)"""
+        with self._lock:
+            self._loop = None
+            self._pid = None
+            self._pools = {}
+
+    def _get_loop(self):
+        """Bucle de eventos del proceso actual, en su propio hilo"""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._pools = {}
+                threading.Thread(target=self._loop.run_forever, name='db-async', daemon=True).start()
+            return self._loop
+
+    def _get_pool(self, name):
+        """Pool de un servidor (se ejecuta en el bucle propio; se crea una sola vez)"""
+        pool = self._pools.get(name)
+        if pool is None:
+            config = self.configs[name]
+            pool = self._pools[name] = asyncio.ensure_future(aiomysql.create_pool(
+                host=config.get('host', 'localhost'),
+                port=int(config.get('port', 3306)),
+                user=config.get('user'),
+                password=config.get('password', ''),
+                db=config.get('database'),
+                maxsize=self.pool_size,
+                autocommit=True
+            ))
+        return pool
+
+    async def _fetch(self, name, sql, params, dictionary, one):
+        try:
+            pool = await self._get_pool(name)
+        except Exception:
+            self._pools.pop(name, None)  # Reintentar la creación en la próxima consulta
+            raise
+        async with pool.acquire() as connection:
+            cursor_class = aiomysql.DictCursor if dictionary else aiomysql.Cursor
+            async with connection.cursor(cursor_class) as cursor:
+                await cursor.execute(sql, params)
+                return await (cursor.fetchone() if one else cursor.fetchall())
+
+    async def _fetch_on(self, name, sql, params, dictionary, one):
+        """Ejecuta la consulta en un servidor, con los errores como mysql.connector.Error"""
+        future = asyncio.run_coroutine_threadsafe(self._fetch(name, sql, params, dictionary, one),
+                                                  self._get_loop())
+        try:
+            return await asyncio.wrap_future(future)
+        except Error:
+            raise
+        except Exception as e:
+            errno = e.args[0] if e.args and isinstance(e.args[0], int) else None
+            raise Error(msg=str(e), errno=errno) from e
+
+    async def fetch(self, sql, params=(), dictionary=True, one=False, use_replica=True):
+        """Ejecuta una consulta de lectura y devuelve sus filas (o la primera con `one`)
+
+        Los errores de aiomysql/PyMySQL se convierten en mysql.connector.Error
+        (con su errno) para que el código de la aplicación los trate igual.
+        """
+        total = len(self._replicas)
+        if use_replica and total:
+            start = next(self._next_replica)
+            for offset in range(total):
+                name = self._replicas[(start + offset) % total]
+                if self._replica_down_until.get(name, 0) > time.monotonic():
+                    continue
+                try:
+                    return await self._fetch_on(name, sql, params, dictionary, one)
+                except Error as e:
+                    if e.errno not in CONNECTION_ERRNOS:
+                        raise
+                    print(f"Réplica {self.configs[name]['host']} no disponible: {e}")
+                    self._replica_down_until[name] = time.monotonic() + self.REPLICA_RETRY_SECONDS
+        return await self._fetch_on('primario', sql, params, dictionary, one)
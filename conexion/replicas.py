@@ -0,0 +1,102 @@
+import itertools
+import os
+import threading
+import time
+
+from mysql.connector import Error, pooling
+from mysql.connector.errors import PoolError
+
+
+def parse_replica_hosts(value):
+    """Convierte 'host1:3307,host2' en una lista de (host, puerto)"""
+    hosts = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if ':' in item:
+            host, port = item.rsplit(':', 1)
+            hosts.append((host, int(port)))
+        else:
+            hosts.append((item, 3306))
+    return hosts
+
+
+class DatabaseRouter:
+    """Reparte las conexiones entre un primario (escrituras) y N réplicas (lecturas)
+
+    Cada proceso mantiene sus propios pools: si se detecta un fork (cambio de
+    pid) los pools heredados se descartan y se crean de nuevo.
+    """
+
+    # Segundos que una réplica caída queda fuera de la rotación
+    REPLICA_RETRY_SECONDS = 10
+
+    def __init__(self, primary_config, replica_hosts=None, pool_size=5):
+        self.primary_config = dict(primary_config)
+        self.replica_configs = []
+        for host, port in replica_hosts or []:
+            config = dict(primary_config)
+            config['host'] = host
+            config['port'] = port
+            self.replica_configs.append(config)
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._next_replica = itertools.count()
+        self._pools = {}
+        self._pid = None
+        self._replica_down_until = {}
+
+    def reset(self):
+        """Descarta todos los pools del proceso actual"""
+        with self._lock:
+            self._pools = {}
+            self._pid = None
+
+    def _get_pool(self, name, config):
+        """Obtiene (o crea) el pool con el nombre indicado para este proceso"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Pools heredados por fork comparten sockets con el padre
+                self._pools = {}
+                self._pid = os.getpid()
+            pool = self._pools.get(name)
+            if pool is None:
+                pool = pooling.MySQLConnectionPool(
+                    pool_name=f'{name}_{os.getpid()}',
+                    pool_size=self.pool_size,
+                    pool_reset_session=True,
+                    **config
+                )
+                self._pools[name] = pool
+            return pool
+
+    def get_primary_connection(self):
+        """Conexión al primario"""
+        return self._get_pool('primario', self.primary_config).get_connection()
+
+    def get_replica_connection(self):
+        """Conexión a una réplica en round-robin; si ninguna responde, al primario"""
+        total = len(self.replica_configs)
+        if total:
+            start = next(self._next_replica)
+            now = time.monotonic()
+            for offset in range(total):
+                index = (start + offset) % total
+                if self._replica_down_until.get(index, 0) > now:
+                    continue
+                try:
+                    return self._get_pool(f'replica{index}', self.replica_configs[index]).get_connection()
+                except PoolError:
+                    # Pool agotado: la réplica está viva, probar con la siguiente
+                    continue
+                except Error as e:
+                    print(f"Réplica {self.replica_configs[index]['host']} no disponible: {e}")
+                    self._replica_down_until[index] = now + self.REPLICA_RETRY_SECONDS
+        return self.get_primary_connection()
+
+    def get_connection(self, read_only=False):
+        """Conexión según el tipo de operación"""
+        if read_only:
+            return self.get_replica_connection()
+        return self.get_primary_connection()
@@ -0,0 +1,113 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mysql.connector import Error
+
+from conexion.replicas import DatabaseRouter, parse_replica_hosts
+
+# Shard de las tiendas que no aparecen en STORE_SHARDS: la base de datos principal
+DEFAULT_SHARD = 'principal'
+
+
+def parse_store_shards(value):
+    """Convierte '1=db-norte:3307,2=db-norte:3307,3=db-sur' en {id_tienda: (host, puerto)}"""
+    shards = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        store_id, _, host = item.partition('=')
+        for host_port in parse_replica_hosts(host):
+            shards[int(store_id)] = host_port
+    return shards
+
+
+class ShardRouter:
+    """Enruta el stock de cada tienda a su instancia de MySQL
+
+    Las tiendas de STORE_SHARDS viven en el host indicado (varias tiendas
+    pueden compartir host); el resto, en la base de datos principal, a la que
+    se accede con `default_connection(read_only)`. Cada shard tiene su pool
+    por proceso (se reutiliza DatabaseRouter, sin réplicas).
+    """
+
+    def __init__(self, base_config, store_hosts, pool_size=5, default_connection=None, max_workers=None):
+        self.default_connection = default_connection
+        primary = (base_config.get('host'), int(base_config.get('port', 3306)))
+        self._store_shard = {}
+        self._routers = {}
+        for store_id, (host, port) in store_hosts.items():
+            if (host, port) == primary:
+                continue  # Misma instancia que la principal: sin pool aparte
+            name = f'{host}:{port}'
+            self._store_shard[store_id] = name
+            if name not in self._routers:
+                config = dict(base_config, host=host, port=port)
+                self._routers[name] = DatabaseRouter(config, [], pool_size)
+        self.max_workers = max_workers or len(self.shard_names())
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def shard_for(self, store_id):
+        """Nombre del shard que guarda el stock de una tienda"""
+        return self._store_shard.get(store_id, DEFAULT_SHARD)
+
+    def shard_names(self):
+        """Todos los shards, empezando por el principal"""
+        return [DEFAULT_SHARD] + sorted(self._routers)
+
+    def get_connection(self, shard, read_only=False):
+        """Conexión a un shard (None si la principal no está disponible)"""
+        if shard == DEFAULT_SHARD:
+            return self.default_connection(read_only)
+        return self._routers[shard].get_primary_connection()
+
+    def reset(self):
+        """Descarta los pools de los shards (tras el fork de cada worker)"""
+        for router in self._routers.values():
+            router.reset()
+
+    def _get_executor(self):
+        """Pool de hilos del proceso actual (los hilos no sobreviven a un fork)"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='shard')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run_on(self, shard, func, read_only):
+        connection = self.get_connection(shard, read_only)
+        if not connection:
+            raise Error(f'No se pudo conectar al shard {shard}')
+        try:
+            return func(connection)
+        finally:
+            connection.close()
+
+    def map(self, func, shards=None, read_only=True):
+        """Ejecuta `func(connection)` en cada shard en paralelo
+
+        Devuelve (resultados, errores): dos dicts por nombre de shard. Un
+        shard caído no tumba la consulta; el llamador decide qué hacer con
+        los resultados parciales.
+        """
+        shards = shards or self.shard_names()
+        if len(shards) == 1:
+            futures = None
+        else:
+            executor = self._get_executor()
+            futures = {shard: executor.submit(self._run_on, shard, func, read_only) for shard in shards}
+
+        results, errors = {}, {}
+        for shard in shards:
+            try:
+                if futures is None:
+                    results[shard] = self._run_on(shard, func, read_only)
+                else:
+                    results[shard] = futures[shard].result()
+            except Error as e:
+                print(f"Error en shard {shard}: {e}")
+                errors[shard] = str(e)
+        return results, errors
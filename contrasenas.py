@@ -0,0 +1,64 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Hay demasiados cálculos de hash en espera: se rechaza la petición"""
+
+
+class PasswordHasher:
+    """Calcula y verifica hashes de contraseñas en un pool de hilos acotado
+
+    El hash es costoso a propósito; hashlib libera el GIL mientras lo calcula,
+    así que un pool pequeño aprovecha varios núcleos sin bloquear a los hilos
+    que atienden peticiones. Si hay más de `max_pending` cálculos en curso o en
+    cola durante más de `queue_timeout` segundos, se lanza HasherBusy.
+    """
+
+    def __init__(self, method='scrypt', workers=2, max_pending=16, queue_timeout=2.0):
+        self.method = method
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._method_prefix = None
+
+    def _get_executor(self):
+        """Pool de hilos del proceso actual (los hilos no sobreviven a un fork)"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hash')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HasherBusy('Demasiadas operaciones de contraseña en curso')
+        try:
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Genera el hash con el método y coste configurados"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        """Comprueba una contraseña contra su hash guardado"""
+        return self._run(check_password_hash, stored_hash, password)
+
+    @property
+    def method_prefix(self):
+        """Método con sus parámetros tal como queda al inicio del hash (p. ej. 'scrypt:32768:8:1')"""
+        if self._method_prefix is None:
+            self._method_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._method_prefix
+
+    def needs_rehash(self, stored_hash):
+        """Indica si el hash guardado usa otro método o coste que el configurado"""
+        return stored_hash.split('$', 1)[0] != self.method_prefix
@@ -0,0 +1,243 @@
+import atexit
+import fcntl
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from trabajos import process_alive
+
+# stock-<id del diario>-<segmento>.log, con id del diario '<pid>-<uuid>'
+JOURNAL_NAME = re.compile(r'^stock-((\d+)-[0-9a-f]{32})-(\d{6})\.log$')
+
+
+def journal_pid(journal_id):
+    """Pid del proceso que escribió un diario"""
+    return int(journal_id.split('-', 1)[0])
+
+
+def read_journal(path):
+    """Entradas (secuencia, id_producto, delta) de un segmento del diario
+
+    Una línea incompleta al final (caída a mitad de escritura) se ignora:
+    ese ajuste no llegó a confirmarse al cliente.
+    """
+    entries = []
+    with open(path, 'r', encoding='ascii', errors='replace') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 3 or not line.endswith('\n'):
+                continue
+            try:
+                entries.append(tuple(int(part) for part in parts))
+            except ValueError:
+                continue
+    return entries
+
+
+class StockBuffer:
+    """Acumula ajustes de stock en memoria y los escribe en MySQL por lotes
+
+    Cada ajuste se anota primero en un diario local (un archivo por proceso,
+    solo se añade al final) y se suma al delta pendiente de su producto.
+    Los diarios de procesos que ya no existen se recuperan con `journals()`. Cada
+    `interval` segundos un hilo llama a `apply(deltas, journal_id, last_seq)`
+    con todos los deltas acumulados: miles de ajustes por segundo acaban en
+    unas pocas sentencias. Al vaciar se cambia de segmento, y los segmentos
+    ya aplicados se borran; si MySQL falla, los deltas vuelven a quedar
+    pendientes y se reintentan en la siguiente ventana.
+
+    `apply` debe guardar `last_seq` en la misma transacción que los deltas:
+    así, al recuperar el diario tras una caída, se sabe qué entradas ya se
+    aplicaron y ninguna se suma dos veces.
+    """
+
+    def __init__(self, journal_dir, apply, interval=1.0, fsync=True):
+        self.journal_dir = journal_dir
+        self.apply = apply
+        self.interval = interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._atexit = False
+
+    def _ensure_process(self):
+        """Estado propio del proceso actual: diario, deltas e hilo de vaciado (con el candado)"""
+        if self._pid == os.getpid():
+            return
+        # Tras un fork no se hereda nada: el diario del maestro sigue siendo suyo
+        self._pid = os.getpid()
+        self.journal_id = f'{self._pid}-{uuid.uuid4().hex}'
+        self._seq = 0
+        self._segment = 0
+        self._file = None
+        self._closed_segments = []
+        self._pending = {}
+        self._inflight = {}
+        self._dirty = 0  # Escrituras directas aún no publicadas
+        os.makedirs(self.journal_dir, exist_ok=True)
+        threading.Thread(target=self._flush_loop, name='stock-flush', daemon=True).start()
+        if not self._atexit:
+            atexit.register(self.flush)
+            self._atexit = True
+
+    def _segment_path(self, segment):
+        return os.path.join(self.journal_dir, f'stock-{self.journal_id}-{segment:06d}.log')
+
+    def add(self, product_id, delta):
+        """Anota un ajuste; cuando vuelve, el ajuste ya está en el diario"""
+        product_id, delta = int(product_id), int(delta)
+        with self._lock:
+            self._ensure_process()
+            if self._file is None:
+                self._file = open(self._segment_path(self._segment), 'a', encoding='ascii')
+            self._seq += 1
+            self._file.write(f'{self._seq} {product_id} {delta}\n')
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._pending[product_id] = self._pending.get(product_id, 0) + delta
+            return self._pending[product_id] + self._inflight.get(product_id, 0)
+
+    def mark_dirty(self):
+        """Anota que este proceso escribió stock directamente: el próximo vaciado lo publica"""
+        with self._lock:
+            self._ensure_process()
+            self._dirty += 1
+
+    def pending(self, product_id):
+        """Delta aún no escrito en MySQL para un producto"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return 0
+            return self._pending.get(product_id, 0) + self._inflight.get(product_id, 0)
+
+    def fingerprint(self):
+        """Huella de lo que este proceso aún no escribió en MySQL (para ETags)
+
+        Vacía si no queda nada pendiente: así todos los workers sin deltas
+        dan el mismo ETag para el mismo contenido.
+        """
+        with self._lock:
+            if self._pid != os.getpid() or not (self._pending or self._inflight or self._dirty):
+                return ''
+            deltas = dict(self._inflight)
+            for product_id, delta in self._pending.items():
+                deltas[product_id] = deltas.get(product_id, 0) + delta
+            state = f'{sorted(deltas.items())}|{self._dirty}'
+        return hashlib.sha1(state.encode()).hexdigest()[:12]
+
+    def merge(self, result):
+        """Suma los deltas pendientes a un producto (dict) o a una lista de productos
+
+        Los dicts afectados se copian: el resultado puede venir de una caché
+        compartida y no se debe modificar.
+        """
+        with self._lock:
+            if self._pid != os.getpid() or not (self._pending or self._inflight):
+                return result
+            deltas = dict(self._inflight)
+            for product_id, delta in self._pending.items():
+                deltas[product_id] = deltas.get(product_id, 0) + delta
+
+        def merged(product):
+            delta = deltas.get(product.get('id'))
+            if not delta:
+                return product
+            return dict(product, cantidad=product['cantidad'] + delta)
+
+        if isinstance(result, dict):
+            return merged(result)
+        if isinstance(result, list):
+            return [merged(product) if isinstance(product, dict) else product for product in result]
+        return result
+
+    def flush(self):
+        """Escribe en MySQL los deltas acumulados; devuelve cuántos productos se actualizaron
+
+        Con `mark_dirty` y sin deltas, se llama a `apply` con un lote vacío.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._pid != os.getpid() or not (self._pending or self._dirty):
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+                self._dirty = 0
+                last_seq = self._seq
+                if batch:
+                    # Las entradas que lleguen mientras tanto van a un segmento nuevo
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+                    self._closed_segments.append(self._segment)
+                    self._segment += 1
+
+            try:
+                self.apply(batch, self.journal_id, last_seq)
+            except Exception as e:
+                print(f"Error al escribir ajustes de stock: {e}")
+                with self._lock:
+                    for product_id, delta in batch.items():
+                        self._pending[product_id] = self._pending.get(product_id, 0) + delta
+                    self._inflight = {}
+                    self._dirty = max(self._dirty, 1)
+                return 0
+
+            with self._lock:
+                self._inflight = {}
+                segments, self._closed_segments = self._closed_segments, []
+            for segment in segments:
+                try:
+                    os.remove(self._segment_path(segment))
+                except FileNotFoundError:
+                    pass
+            return len(batch)
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:  # El hilo no debe morir por un error inesperado
+                print(f"Error en el vaciado de stock: {e}")
+
+    @contextmanager
+    def recovery_lock(self):
+        """Candado entre procesos: dos workers nuevos no recuperan el mismo diario a la vez"""
+        os.makedirs(self.journal_dir, exist_ok=True)
+        with open(os.path.join(self.journal_dir, '.recuperacion.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def journals(self):
+        """Diarios huérfanos en disco: {id_diario: (entradas, rutas)}
+
+        Solo se devuelven los de procesos que ya no existen (un worker
+        reciclado o matado); los de procesos vivos siguen siendo suyos.
+        Llamar con `recovery_lock()` tomado.
+        """
+        found = {}
+        if not os.path.isdir(self.journal_dir):
+            return found
+        for name in sorted(os.listdir(self.journal_dir)):
+            match = JOURNAL_NAME.match(name)
+            if not match:
+                continue
+            pid = int(match.group(2))
+            if pid == os.getpid() or process_alive(pid):
+                continue
+            path = os.path.join(self.journal_dir, name)
+            entries, paths = found.setdefault(match.group(1), ([], []))
+            entries.extend(read_journal(path))
+            paths.append(path)
+        return found
+
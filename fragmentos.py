@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """Caché LRU de fragmentos HTML ya renderizados
+
+    Cada entrada se identifica por (fragmento, id del producto, versión), donde
+    la versión es una huella de los campos que se muestran: una fila
+    modificada genera otra clave, así que nunca se sirve HTML viejo aunque la
+    escritura haya ocurrido en otro worker. `invalidate` libera antes la memoria de las
+    versiones obsoletas cuando la escritura ocurre en este proceso.
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_product = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, name, product_id, version, render):
+        """Devuelve el fragmento cacheado o lo genera con `render()`"""
+        key = (name, product_id, version)
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        # Se renderiza fuera del candado para no serializar a los demás hilos
+        html = render()
+        with self._lock:
+            self._entries[key] = html
+            self._keys_by_product.setdefault(product_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+        return html
+
+    def _forget(self, key):
+        keys = self._keys_by_product.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_product[key[1]]
+
+    def invalidate(self, product_id):
+        """Descarta todos los fragmentos de un producto"""
+        with self._lock:
+            for key in self._keys_by_product.pop(product_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Vacía la caché"""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_product.clear()
@@ -0,0 +1,76 @@
+"""
+Configuración de gunicorn para servir la aplicación en producción
+Ejecutar: python serve.py  (o bien: gunicorn -c gunicorn.conf.py app:app)
+
+Con preload_app, kill -HUP solo reinicia los workers con el código ya cargado
+en el maestro (ni se reconstruyen los estáticos ni se ejecuta init_db): sirve
+para reciclarlos, no para desplegar. Para desplegar código nuevo sin cortar
+peticiones:
+
+    kill -USR2 $(cat gunicorn.pid)           # arranca un maestro nuevo con el código nuevo
+    kill -WINCH $(cat gunicorn.pid.oldbin)   # el viejo deja de atender cuando el nuevo ya responde
+    kill -QUIT $(cat gunicorn.pid.oldbin)    # y termina sus peticiones en curso antes de salir
+
+(si el nuevo falla, kill -HUP al viejo recupera sus workers y kill -QUIT al nuevo)
+"""
+
+import multiprocessing
+import os
+
+# Dirección de escucha
+bind = os.getenv('BIND', '0.0.0.0:5000')
+
+# Procesos pre-fork: por defecto uno por núcleo
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count()))
+
+# Hilos por worker (gthread): permite solapar la espera de MySQL
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '4'))
+
+# Cargar la aplicación una sola vez en el maestro; los workers comparten
+# la memoria copy-on-write tras el fork
+preload_app = True
+
+# Reciclar workers tras N peticiones (con jitter para no reiniciarlos a la vez)
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('WEB_MAX_REQUESTS_JITTER', '200'))
+
+# Tiempos de espera
+timeout = int(os.getenv('WEB_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+pidfile = os.getenv('WEB_PIDFILE', 'gunicorn.pid')
+accesslog = '-'
+errorlog = '-'
+
+# Cada hilo necesita su propia conexión: el pool de cada worker se
+# dimensiona con el número de hilos salvo que se indique otra cosa (las
+# importaciones y demás trabajo en segundo plano usan DB_BACKGROUND_POOL_SIZE)
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+
+
+def on_starting(server):
+    """Preparar directorios, tablas y estáticos una sola vez, en el proceso maestro"""
+    import build_assets
+    from app import ensure_data_directory, init_db, reset_connection_pool
+    build_assets.build()
+    ensure_data_directory()
+    init_db()
+    # No dejar conexiones abiertas en el maestro que luego hereden los workers
+    reset_connection_pool()
+
+
+def post_fork(server, worker):
+    """Cada worker abre su propio pool de conexiones y recoge lo que dejaron los workers muertos"""
+    from app import reclaim_orphans, reset_connection_pool
+    reset_connection_pool()
+    reclaim_orphans()
+
+
+def worker_exit(server, worker):
+    """Antes de que el worker termine: parar sus importaciones y escribir el stock pendiente"""
+    from app import import_jobs, stock_buffer
+    # Sin latido desde aquí: hay que acabar antes de que el maestro lo mate
+    import_jobs.shutdown(timeout=min(10, timeout / 2))
+    stock_buffer.flush()
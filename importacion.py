@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import math
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Formatos que se pueden partir por líneas: un registro por línea
+FORMATOS_PARALELOS = ('csv', 'jsonl')
+
+# Límites de las columnas de `productos`: una fila fuera de rango es inválida
+# (MySQL la rechazaría o, con INSERT IGNORE, la recortaría sin avisar)
+MAX_NOMBRE = 200
+MAX_CATEGORIA = 100
+MAX_CANTIDAD = 2 ** 31 - 1  # INT
+MAX_PRECIO = 99999999.99  # DECIMAL(10,2)
+
+
+def validate_product(row):
+    """Convierte una fila (dict) en la tupla que se inserta; ValueError si no es válida"""
+    try:
+        nombre = row['nombre'].strip()
+        values = (
+            nombre,
+            row.get('descripcion') or '',
+            int(row['cantidad']),
+            float(row['precio']),
+            (row.get('categoria') or '').strip() or 'General'
+        )
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f'Fila inválida: {e}')
+    if not nombre or values[2] < 0 or values[3] < 0:
+        raise ValueError('Fila inválida')
+    if (len(nombre) > MAX_NOMBRE or len(values[4]) > MAX_CATEGORIA or values[2] > MAX_CANTIDAD
+            or not math.isfinite(values[3]) or round(values[3], 2) > MAX_PRECIO):
+        raise ValueError('Fila inválida: valor fuera de rango')
+    return values
+
+
+def read_csv_header(file_path):
+    """Nombres de columna de la primera línea de un CSV"""
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+        return next(csv.reader([f.readline()]), [])
+
+
+def chunk_ranges(file_path, chunk_size, skip_header=False, quoted=False):
+    """Parte el archivo en rangos de bytes (inicio, fin) que terminan en un salto de línea
+
+    Cada rango empieza justo después de un '\\n', así que ningún registro
+    queda partido entre dos trozos. Con `quoted` (CSV) solo se corta en un
+    salto de línea con un número par de comillas desde el inicio del trozo:
+    los saltos dentro de un campo entrecomillado no son fin de registro (las
+    comillas escapadas "" suman dos y no cambian la paridad).
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+    ranges = []
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        if skip_header:
+            newline = mm.find(b'\n')
+            start = size if newline == -1 else newline + 1
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                scanned, odd = start, 0
+                newline = mm.find(b'\n', end - 1)
+                while newline != -1 and quoted:
+                    odd ^= mm[scanned:newline].count(b'"') & 1
+                    scanned = newline
+                    if not odd:
+                        break
+                    newline = mm.find(b'\n', newline + 1)
+                end = size if newline == -1 else newline + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_chunk(task):
+    """Lee y valida un rango del archivo (se ejecuta en un proceso del pool)
+
+    Devuelve (filas_validas, procesadas, fallidas). Solo se copia a memoria el
+    trozo propio: el archivo se abre con mmap.
+    """
+    file_path, start, end, formato, fieldnames = task
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode('utf-8', errors='replace')
+
+    if formato == 'csv':
+        rows = csv.DictReader(io.StringIO(text, newline=''), fieldnames=fieldnames)
+    else:
+        rows = (line for line in text.splitlines() if line.strip())
+
+    valid = []
+    processed = failed = 0
+    for row in rows:
+        processed += 1
+        try:
+            if formato == 'jsonl':
+                row = json.loads(row)
+                if not isinstance(row, dict):
+                    raise ValueError('Se esperaba un objeto')
+            valid.append(validate_product(row))
+        except ValueError:  # json.JSONDecodeError también es ValueError
+            failed += 1
+    return valid, processed, failed
+
+
+def iter_parsed_chunks(file_path, formato, workers=None, chunk_size=8 * 1024 * 1024):
+    """Valida el archivo en paralelo y entrega los trozos en el orden del archivo
+
+    Genera (filas_validas, procesadas, fallidas, bytes_del_trozo). Solo hay
+    `2 * workers` trozos en vuelo, así que la memoria no crece aunque la
+    inserción vaya más lenta que el análisis. Los procesos se crean con
+    'spawn': hacer fork de un worker con hilos puede dejar locks tomados.
+    """
+    if formato not in FORMATOS_PARALELOS:
+        raise ValueError(f'Formato no divisible en trozos: {formato}')
+    workers = workers or os.cpu_count() or 1
+    fieldnames = read_csv_header(file_path) if formato == 'csv' else None
+    ranges = chunk_ranges(file_path, chunk_size, skip_header=formato == 'csv', quoted=formato == 'csv')
+    if not ranges:
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as executor:
+        pending = deque()
+        tasks = iter(ranges)
+        try:
+            for start, end in tasks:
+                pending.append((executor.submit(parse_chunk, (file_path, start, end, formato, fieldnames)),
+                                end - start))
+                if len(pending) >= 2 * workers:
+                    future, size = pending.popleft()
+                    yield future.result() + (size,)
+            while pending:
+                future, size = pending.popleft()
+                yield future.result() + (size,)
+        finally:
+            # Si el consumidor se detiene (cancelación) no se analiza el resto
+            for future, _ in pending:
+                future.cancel()
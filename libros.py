@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def _isbn10_check_digit(digits):
+    """Dígito de control de un ISBN-10 (recibe los 9 primeros dígitos)"""
+    total = sum((10 - i) * int(d) for i, d in enumerate(digits))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def _isbn13_check_digit(digits):
+    """Dígito de control de un ISBN-13 (recibe los 12 primeros dígitos)"""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(raw):
+    """Normaliza un ISBN-10 o ISBN-13 escaneado a ISBN-13 sin guiones
+
+    Devuelve None si el código no es un ISBN válido.
+    """
+    if raw is None:
+        return None
+    code = ''.join(c for c in str(raw).upper() if c.isdigit() or c == 'X')
+    if len(code) == 10:
+        if not code[:9].isdigit() or _isbn10_check_digit(code[:9]) != code[9]:
+            return None
+        base = '978' + code[:9]
+        return base + _isbn13_check_digit(base)
+    if len(code) == 13 and code.isdigit() and code[:3] in ('978', '979'):
+        if _isbn13_check_digit(code[:12]) != code[12]:
+            return None
+        return code
+    return None
+
+
+class HotIsbnCache:
+    """Caché LRU en memoria de los libros consultados por ISBN
+
+    Guarda el resultado durante `ttl` segundos (el stock cambia, así que la
+    vida es corta) y como máximo `max_entries` ISBN distintos.
+    """
+
+    def __init__(self, max_entries=5000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get_many(self, isbns):
+        """Devuelve (encontrados, faltantes) para una lista de ISBN normalizados"""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for isbn in isbns:
+                entry = self._entries.get(isbn)
+                if entry and entry[0] > now:
+                    self._entries.move_to_end(isbn)
+                    found[isbn] = entry[1]
+                else:
+                    missing.append(isbn)
+        return found, missing
+
+    def put_many(self, books):
+        """Guarda libros indexados por ISBN"""
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for isbn, book in books.items():
+                self._entries[isbn] = (expires, book)
+                self._entries.move_to_end(isbn)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, isbns=None):
+        """Descarta ISBN concretos (o toda la caché)"""
+        with self._lock:
+            if isbns is None:
+                self._entries.clear()
+            else:
+                for isbn in isbns:
+                    self._entries.pop(isbn, None)
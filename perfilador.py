@@ -0,0 +1,216 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# Categorías en que se reparte el tiempo de una petición
+CATEGORIAS = ('db', 'template', 'export', 'python')
+
+# Rutas de módulos que identifican cada categoría (se mira desde la hoja hacia arriba)
+_DB_PATHS = (os.sep + 'mysql' + os.sep, os.sep + 'conexion' + os.sep, 'sqlite3')
+_TEMPLATE_PATHS = (os.sep + 'jinja2' + os.sep, os.sep + 'markupsafe' + os.sep)
+
+
+def classify(frames):
+    """Categoría de una muestra; `frames` va de la hoja a la raíz"""
+    for code in frames:
+        filename = code.co_filename
+        if any(path in filename for path in _DB_PATHS):
+            return 'db'
+        if any(path in filename for path in _TEMPLATE_PATHS):
+            return 'template'
+        if code.co_name.startswith('export_'):
+            return 'export'
+    return 'python'
+
+
+def frame_label(code):
+    """Nombre de un frame en la pila colapsada: archivo:función"""
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+class _Session:
+    """Muestras de una petición en curso"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.categories = Counter()
+
+
+class RequestProfiler:
+    """Perfilador por muestreo para peticiones de producción
+
+    Se perfila una fracción `sample_rate` de las peticiones, más las que
+    traen la cabecera `X-Perfil` con un token firmado. Un hilo recorre cada
+    `interval` segundos las pilas de los hilos perfilados (sys._current_frames)
+    y al terminar la petición se guarda un archivo de pilas colapsadas
+    (formato de flamegraph.pl / speedscope) con la categoría como raíz.
+    Sin peticiones perfiladas el hilo está dormido: el coste es mirar una
+    cabecera y, si sample_rate > 0, un número aleatorio.
+    """
+
+    HEADER = 'X-Perfil'
+
+    def __init__(self, output_dir, sample_rate=0.0, interval=0.005, max_files=200,
+                 secret_key=None, token_max_age=3600):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_files = max_files
+        self.token_max_age = token_max_age
+        self._serializer = URLSafeTimedSerializer(secret_key, salt='perfilador') if secret_key else None
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        """Registra los hooks de petición en la aplicación Flask"""
+        from flask import request
+
+        if self._serializer is None:
+            self._serializer = URLSafeTimedSerializer(app.secret_key, salt='perfilador')
+
+        @app.before_request
+        def _start_profile():
+            if self.should_profile(request.headers.get(self.HEADER)):
+                self.start(f'{request.method} {request.endpoint or request.path}')
+
+        @app.after_request
+        def _stop_profile(response):
+            timings = self.stop()
+            if timings:
+                response.headers['Server-Timing'] = ', '.join(
+                    f'{name};dur={ms:.1f}' for name, ms in timings.items())
+            return response
+
+        @app.teardown_request
+        def _discard_profile(error=None):
+            # Si la vista lanzó una excepción no pasa por after_request
+            self.stop()
+
+    # ----- Activación -----
+
+    def make_token(self):
+        """Token firmado para perfilar una petición concreta con la cabecera X-Perfil"""
+        return self._serializer.dumps('perfilar')
+
+    def should_profile(self, token=None):
+        """Decide si se perfila la petición actual"""
+        if token:
+            try:
+                self._serializer.loads(token, max_age=self.token_max_age)
+                return True
+            except BadSignature:
+                pass
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    # ----- Sesiones -----
+
+    def start(self, name):
+        """Empieza a muestrear el hilo actual"""
+        with self._lock:
+            self._sessions[threading.get_ident()] = _Session(name)
+            self._ensure_sampler()
+        self._wakeup.set()
+
+    def stop(self):
+        """Termina la sesión del hilo actual, guarda el perfil y devuelve ms por categoría"""
+        with self._lock:
+            session = self._sessions.pop(threading.get_ident(), None)
+            if not self._sessions:
+                self._wakeup.clear()
+        if session is None:
+            return None
+
+        elapsed_ms = (time.perf_counter() - session.started) * 1000
+        total = sum(session.categories.values())
+        timings = {'total': elapsed_ms}
+        for categoria in CATEGORIAS:
+            # Las muestras reparten el tiempo real medido de la petición
+            timings[categoria] = elapsed_ms * session.categories[categoria] / total if total else 0.0
+        if total:
+            self._write(session)
+        return timings
+
+    def _ensure_sampler(self):
+        """Arranca el hilo de muestreo del proceso actual (no sobrevive a un fork)"""
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._sample_loop, name='perfilador', daemon=True)
+            self._thread.start()
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            # Con el lock: stop() no puede retirar la sesión mientras se anota
+            with self._lock:
+                for ident, session in self._sessions.items():
+                    if ident == own or ident not in frames:
+                        continue
+                    codes = []
+                    frame = frames[ident]
+                    while frame is not None:
+                        codes.append(frame.f_code)
+                        frame = frame.f_back
+                    categoria = classify(codes)
+                    stack = ';'.join([categoria] + [frame_label(code) for code in reversed(codes)])
+                    session.categories[categoria] += 1
+                    session.stacks[stack] += 1
+            del frames
+
+    # ----- Archivos -----
+
+    def _write(self, session):
+        """Guarda las pilas colapsadas de la sesión y poda los archivos más viejos"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_name = ''.join(c if c.isalnum() else '_' for c in session.name).strip('_')
+        filename = f'{time.strftime("%Y%m%d-%H%M%S")}-{threading.get_ident() % 100000:05d}-{safe_name}.folded'
+        path = os.path.join(self.output_dir, filename)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            for stack, count in session.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        os.replace(path + '.tmp', path)
+
+        files = self.list_profiles()
+        for old in files[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.output_dir, old['nombre']))
+            except OSError:
+                pass
+
+    def list_profiles(self):
+        """Perfiles guardados, del más reciente al más antiguo"""
+        if not os.path.isdir(self.output_dir):
+            return []
+        profiles = []
+        for name in os.listdir(self.output_dir):
+            if name.endswith('.folded'):
+                stat = os.stat(os.path.join(self.output_dir, name))
+                profiles.append({'nombre': name, 'bytes': stat.st_size, 'fecha': stat.st_mtime})
+        profiles.sort(key=lambda p: p['fecha'], reverse=True)
+        return profiles
+
+    def merged(self):
+        """Suma de todos los perfiles guardados en un solo archivo de pilas colapsadas"""
+        stacks = Counter()
+        for profile in self.list_profiles():
+            try:
+                with open(os.path.join(self.output_dir, profile['nombre']), encoding='utf-8') as f:
+                    for line in f:
+                        stack, _, count = line.rstrip('\n').rpartition(' ')
+                        if stack and count.isdigit():
+                            stacks[stack] += int(count)
+            except OSError:
+                continue  # Podado mientras se leía
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
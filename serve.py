@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Servidor de producción: gunicorn multiproceso con la aplicación precargada
+Ejecutar: python serve.py
+
+Variables de entorno principales (ver gunicorn.conf.py):
+    WEB_WORKERS        procesos worker (por defecto, núcleos de la máquina)
+    WEB_THREADS        hilos por worker
+    WEB_MAX_REQUESTS   peticiones antes de reciclar un worker
+    DB_POOL_SIZE       conexiones MySQL por worker (por defecto, WEB_THREADS)
+    DB_BACKGROUND_POOL_SIZE  conexiones extra por worker para trabajos en segundo plano
+
+Para desarrollo se sigue usando: python app.py
+"""
+
+import os
+import sys
+
+from gunicorn.app.wsgiapp import run
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    """Función principal"""
+    os.chdir(BASE_DIR)
+    sys.argv = [sys.argv[0], '-c', os.path.join(BASE_DIR, 'gunicorn.conf.py'), 'app:app'] + sys.argv[1:]
+    run()
+
+
+if __name__ == "__main__":
+    main()
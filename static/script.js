@@ -207,10 +207,16 @@ document.addEventListener('DOMContentLoaded', function() {
             // Auto-focus en campos de búsqueda
             searchInput.focus();
             
+            // Sugerencias mientras se escribe
+            const suggestions = initSearchSuggestions(searchInput);
+            
             // Búsqueda con Enter
             searchInput.addEventListener('keypress', function(event) {
                 if (event.key === 'Enter') {
                     event.preventDefault();
+                    if (suggestions && suggestions.openActive()) {
+                        return;
+                    }
                     if (searchForm) {
                         searchForm.submit();
                     }
@@ -233,6 +239,121 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Sugerencias de búsqueda: debounce y cancelación de peticiones obsoletas
+    function initSearchSuggestions(searchInput) {
+        const suggestUrl = searchInput.dataset.suggestUrl;
+        if (!suggestUrl) return null;
+        
+        const list = document.createElement('ul');
+        list.className = 'suggestions-list';
+        list.hidden = true;
+        searchInput.parentNode.appendChild(list);
+        
+        let debounceTimer = null;
+        let controller = null;
+        let activeIndex = -1;
+        
+        function hideList() {
+            list.hidden = true;
+            list.innerHTML = '';
+            activeIndex = -1;
+        }
+        
+        function setActive(index) {
+            const items = list.querySelectorAll('.suggestion-item');
+            if (!items.length) return;
+            activeIndex = (index + items.length) % items.length;
+            items.forEach((item, i) => item.classList.toggle('active', i === activeIndex));
+        }
+        
+        function render(sugerencias) {
+            hideList();
+            sugerencias.forEach(item => {
+                const li = document.createElement('li');
+                li.className = 'suggestion-item';
+                const link = document.createElement('a');
+                link.href = item.url;
+                const label = document.createElement('span');
+                const meta = document.createElement('span');
+                meta.className = 'suggestion-meta';
+                if (item.tipo === 'categoria') {
+                    label.textContent = item.categoria;
+                    meta.textContent = `Categoría · ${item.total}`;
+                } else {
+                    label.textContent = item.nombre;
+                    meta.textContent = item.categoria;
+                }
+                link.appendChild(label);
+                link.appendChild(meta);
+                li.appendChild(link);
+                list.appendChild(li);
+            });
+            list.hidden = sugerencias.length === 0;
+        }
+        
+        function fetchSuggestions(term) {
+            // Cancelar la petición anterior si todavía no ha respondido
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            const url = `${suggestUrl}?q=${encodeURIComponent(term)}`;
+            fetch(url, { signal: controller.signal, headers: { 'Accept': 'application/json' } })
+                .then(response => response.ok ? response.json() : { sugerencias: [] })
+                .then(data => {
+                    // Ignorar respuestas que ya no corresponden al texto actual
+                    if (searchInput.value.trim() === term) {
+                        render(data.sugerencias || []);
+                    }
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') {
+                        hideList();
+                    }
+                });
+        }
+        
+        searchInput.addEventListener('input', function() {
+            clearTimeout(debounceTimer);
+            const term = searchInput.value.trim();
+            if (!term) {
+                if (controller) controller.abort();
+                hideList();
+                return;
+            }
+            debounceTimer = setTimeout(() => fetchSuggestions(term), 150);
+        });
+        
+        searchInput.addEventListener('keydown', function(event) {
+            if (list.hidden) return;
+            if (event.key === 'ArrowDown') {
+                event.preventDefault();
+                setActive(activeIndex + 1);
+            } else if (event.key === 'ArrowUp') {
+                event.preventDefault();
+                setActive(activeIndex - 1);
+            } else if (event.key === 'Escape') {
+                hideList();
+            }
+        });
+        
+        searchInput.addEventListener('blur', function() {
+            // Dejar tiempo para que el clic en una sugerencia llegue al enlace
+            setTimeout(hideList, 200);
+        });
+        
+        return {
+            openActive() {
+                const active = list.querySelector('.suggestion-item.active a');
+                if (!list.hidden && active) {
+                    window.location.href = active.href;
+                    return true;
+                }
+                return false;
+            }
+        };
+    }
+    
     // Ordenamiento de tablas
     function initTableSorting() {
         const tables = document.querySelectorAll('.products-table');
@@ -0,0 +1,194 @@
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+
+def fold_text(text):
+    """Normaliza texto para comparar: minúsculas y sin acentos"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+class SuggestionIndex:
+    """Índice de prefijos en memoria para sugerencias de búsqueda
+
+    Mantiene tres arreglos ordenados de tuplas (clave, id) y busca con bisect:
+    - nombres: el nombre completo del producto
+    - palabras: cada palabra del nombre (a partir de la segunda)
+    - categorias: nombre de la categoría
+
+    Los resultados se devuelven en ese orden de prioridad, de modo que una
+    consulta cuesta O(log n + limite) sin recorrer todo el catálogo.
+
+    `upsert`/`remove` solo actualizan este proceso; con `version()` (un
+    contador compartido que sube con cada escritura) el índice se
+    reconstruye en cuanto otro proceso cambia el catálogo. La reconstrucción
+    se hace fuera del candado y en un solo hilo: mientras tanto las consultas
+    usan el índice anterior.
+    """
+
+    def __init__(self, loader, ttl=300, version=None):
+        self._loader = loader
+        self._ttl = ttl
+        self._version = version
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._loaded_at = None
+        self._loaded_version = None
+        self._products = {}
+        self._names = []
+        self._words = []
+        self._categories = {}
+        self._category_keys = []
+
+    def invalidate(self):
+        """Fuerza la reconstrucción en la próxima consulta"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _is_current(self, version):
+        # Sin versión disponible (MySQL caído) se mantiene el índice actual
+        return (self._loaded_at is not None and time.monotonic() - self._loaded_at < self._ttl
+                and (version is None or version == self._loaded_version))
+
+    def _ensure_loaded(self):
+        """Reconstruye el índice si caducó o si otro proceso cambió el catálogo"""
+        version = self._version() if self._version else None
+        if self._is_current(version):
+            return
+        # Si otro hilo ya está reconstruyendo, se responde con el índice actual
+        # (solo se espera en la primera carga, cuando todavía no hay índice)
+        if not self._build_lock.acquire(blocking=not self._built):
+            return
+        try:
+            if self._is_current(version):
+                return
+            products = self._loader()
+            fresh = SuggestionIndex(None)
+            for product in products:
+                fresh._add(product)
+            fresh._names.sort()
+            fresh._words.sort()
+            fresh._category_keys = sorted(fresh._categories)
+            with self._lock:
+                self._products = fresh._products
+                self._names = fresh._names
+                self._words = fresh._words
+                self._categories = fresh._categories
+                self._category_keys = fresh._category_keys
+                self._built = True
+                # Un catálogo vacío (o un fallo de la base) se vuelve a cargar en la siguiente consulta
+                self._loaded_at = time.monotonic() if products else None
+                self._loaded_version = version
+        finally:
+            self._build_lock.release()
+
+    @staticmethod
+    def _keys_for(product):
+        name = fold_text(product['nombre'])
+        return name, name.split()[1:]
+
+    def _add(self, product, keep_sorted=False):
+        """Agrega un producto a los arreglos (ordenando solo si keep_sorted)"""
+        product_id = product['id']
+        entry = {'id': product_id, 'nombre': product['nombre'], 'categoria': product.get('categoria') or ''}
+        self._products[product_id] = entry
+        name, words = self._keys_for(entry)
+        add = insort if keep_sorted else list.append
+        add(self._names, (name, product_id))
+        for word in words:
+            add(self._words, (word, product_id))
+        category = fold_text(entry['categoria'])
+        if category:
+            if category not in self._categories:
+                self._categories[category] = [entry['categoria'], 0]
+                if keep_sorted:
+                    insort(self._category_keys, category)
+            self._categories[category][1] += 1
+
+    def _discard(self, product_id):
+        """Quita un producto de los arreglos"""
+        entry = self._products.pop(product_id, None)
+        if entry is None:
+            return
+        name, words = self._keys_for(entry)
+        for array, key in [(self._names, name)] + [(self._words, w) for w in words]:
+            position = bisect_left(array, (key, product_id))
+            if position < len(array) and array[position] == (key, product_id):
+                del array[position]
+        category = fold_text(entry['categoria'])
+        if category in self._categories:
+            self._categories[category][1] -= 1
+            if self._categories[category][1] <= 0:
+                del self._categories[category]
+                position = bisect_left(self._category_keys, category)
+                if position < len(self._category_keys) and self._category_keys[position] == category:
+                    del self._category_keys[position]
+
+    def _applied(self, version):
+        """Da por vista la versión que dejó una escritura de este proceso
+
+        Solo si es la siguiente a la cargada: si en medio escribió otro
+        proceso, la próxima consulta reconstruye igualmente.
+        """
+        if version is not None and self._loaded_version is not None and version == self._loaded_version + 1:
+            self._loaded_version = version
+
+    def upsert(self, product, version=None):
+        """Agrega o actualiza un producto tras una escritura (`version`: la que dejó esa escritura)"""
+        with self._lock:
+            if not self._built:
+                return
+            self._discard(product['id'])
+            self._add(product, keep_sorted=True)
+            self._applied(version)
+
+    def remove(self, product_id, version=None):
+        """Quita un producto eliminado"""
+        with self._lock:
+            if not self._built:
+                return
+            self._discard(product_id)
+            self._applied(version)
+
+    @staticmethod
+    def _scan(array, prefix, limit, seen):
+        """Recorre las entradas que empiezan por el prefijo"""
+        found = []
+        position = bisect_left(array, (prefix,))
+        while position < len(array) and len(found) < limit:
+            key, product_id = array[position]
+            if not key.startswith(prefix):
+                break
+            if product_id not in seen:
+                seen.add(product_id)
+                found.append(product_id)
+            position += 1
+        return found
+
+    def suggest(self, term, limit=8):
+        """Devuelve hasta `limit` sugerencias para el prefijo dado"""
+        prefix = fold_text(term)
+        if not prefix:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            seen = set()
+            ids = self._scan(self._names, prefix, limit, seen)
+            if len(ids) < limit:
+                ids += self._scan(self._words, prefix, limit - len(ids), seen)
+            results = [dict(self._products[product_id], tipo='producto') for product_id in ids]
+
+            position = bisect_left(self._category_keys, prefix)
+            while position < len(self._category_keys) and len(results) < limit:
+                key = self._category_keys[position]
+                if not key.startswith(prefix):
+                    break
+                display, count = self._categories[key]
+                results.append({'tipo': 'categoria', 'categoria': display, 'total': count})
+                position += 1
+            return results
@@ -0,0 +1,43 @@
+import pytest
+
+import app as aplicacion
+
+
+@pytest.fixture
+def admision_saturada(monkeypatch):
+    """Ocupa todos los huecos de admisión del proceso durante la prueba"""
+    admission = aplicacion.db_admission
+    monkeypatch.setattr(admission, 'queue_timeout', 0.05)
+    for _ in range(admission.max_inflight):
+        admission.acquire()
+    yield admission
+    for _ in range(admission.max_inflight):
+        admission.release()
+
+
+def test_pagina_con_sesion_responde_503_con_admision_saturada(admision_saturada):
+    client = aplicacion.app.test_client()
+    with client.session_transaction() as session:
+        # Un usuario que este worker no ha cargado todavía (sin copia en caché)
+        session['_user_id'] = '987654321'
+        session['_fresh'] = True
+    rejected = admision_saturada.rejected
+
+    response = client.get('/inventario', headers={'Accept': 'text/html'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+    assert 'Servicio no disponible' in response.get_data(as_text=True)
+    # Una sola espera de admisión por petición rechazada
+    assert admision_saturada.rejected == rejected + 1
+
+
+def test_api_responde_503_en_json_con_admision_saturada(admision_saturada):
+    client = aplicacion.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '987654321'
+
+    response = client.get('/api/estadisticas')
+
+    assert response.status_code == 503
+    assert response.get_json()['reintentar_en'] >= 1
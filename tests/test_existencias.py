@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from existencias import StockBuffer, read_journal
+
+
+class FakeApply:
+    """Sustituye a apply_stock_deltas: suma los deltas y guarda la posición de cada diario"""
+
+    def __init__(self):
+        self.applied = {}
+        self.positions = {}
+        self.fail = False
+
+    def __call__(self, deltas, journal_id, last_seq):
+        if self.fail:
+            raise RuntimeError('MySQL caído')
+        for product_id, delta in deltas.items():
+            self.applied[product_id] = self.applied.get(product_id, 0) + delta
+        self.positions[journal_id] = max(self.positions.get(journal_id, 0), last_seq)
+
+
+@pytest.fixture
+def apply():
+    return FakeApply()
+
+
+@pytest.fixture
+def buffer(tmp_path, apply):
+    return StockBuffer(str(tmp_path), apply, interval=3600)
+
+
+def journal_files(path):
+    return [name for name in os.listdir(path) if name.startswith('stock-')]
+
+
+def test_vaciado_agrupa_los_ajustes_y_borra_el_diario(buffer, apply, tmp_path):
+    for _ in range(1000):
+        buffer.add(1, 2)
+        buffer.add(2, -1)
+
+    assert buffer.merge({'id': 1, 'cantidad': 5})['cantidad'] == 2005
+    assert buffer.flush() == 2
+    assert apply.applied == {1: 2000, 2: -1000}
+    assert apply.positions[buffer.journal_id] == 2000
+    assert journal_files(tmp_path) == []
+    assert buffer.pending(1) == 0
+
+
+def test_vaciado_fallido_conserva_los_deltas_y_el_diario(buffer, apply, tmp_path):
+    apply.fail = True
+    buffer.add(3, 7)
+
+    assert buffer.flush() == 0
+    assert buffer.pending(3) == 7
+    assert len(journal_files(tmp_path)) == 1
+
+    apply.fail = False
+    assert buffer.flush() == 1
+    assert apply.applied == {3: 7}
+    assert journal_files(tmp_path) == []
+
+
+def test_huella_vacia_sin_pendientes(buffer):
+    assert buffer.fingerprint() == ''
+    buffer.add(1, 1)
+    assert buffer.fingerprint() != ''
+    buffer.flush()
+    assert buffer.fingerprint() == ''
+    buffer.mark_dirty()
+    assert buffer.fingerprint() != ''
+    buffer.flush()
+    assert buffer.fingerprint() == ''
+
+
+def test_read_journal_ignora_una_linea_cortada(tmp_path):
+    path = tmp_path / 'segmento.log'
+    path.write_text('1 3 7\n2 3 -1\n5000 3 1')
+
+    assert read_journal(str(path)) == [(1, 3, 7), (2, 3, -1)]
+
+
+def test_recuperacion_solo_devuelve_diarios_de_procesos_muertos(buffer, apply, tmp_path):
+    buffer.add(1, 4)
+    buffer.flush()
+    apply.fail = True
+    buffer.add(3, 7)
+    buffer.flush()
+
+    # El diario de este proceso (vivo) no es huérfano
+    with buffer.recovery_lock():
+        assert buffer.journals() == {}
+
+    # Lo renombramos como si fuera de un proceso que ya no existe
+    dead_id = buffer.journal_id.replace(f'{os.getpid()}-', '999999999-', 1)
+    for name in journal_files(tmp_path):
+        os.rename(tmp_path / name, tmp_path / name.replace(buffer.journal_id, dead_id))
+    with buffer.recovery_lock():
+        orphans = buffer.journals()
+
+    entries, paths = orphans[dead_id]
+    recovered = [entry for entry in entries if entry[0] > apply.positions[buffer.journal_id]]
+    assert recovered == [(2, 3, 7)]
+    assert len(paths) == 1
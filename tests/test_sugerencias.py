@@ -0,0 +1,72 @@
+import threading
+
+from sugerencias import SuggestionIndex
+
+
+class Catalogo:
+    """Catálogo y contador de versión compartidos, como en `contadores`"""
+
+    def __init__(self, products):
+        self.products = list(products)
+        self.version = 1
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return list(self.products)
+
+
+def nombres(results):
+    return [item['nombre'] for item in results if item['tipo'] == 'producto']
+
+
+def test_escritura_propia_no_reconstruye_el_indice():
+    catalogo = Catalogo([{'id': 1, 'nombre': 'Manzana', 'categoria': 'Fruta'}])
+    index = SuggestionIndex(catalogo.load, version=lambda: catalogo.version)
+    index.suggest('man')
+
+    catalogo.products.append({'id': 2, 'nombre': 'Mango', 'categoria': 'Fruta'})
+    catalogo.version += 1
+    index.upsert({'id': 2, 'nombre': 'Mango', 'categoria': 'Fruta'}, catalogo.version)
+
+    assert nombres(index.suggest('man')) == ['Mango', 'Manzana']
+    assert catalogo.loads == 1
+
+
+def test_escritura_de_otro_worker_reconstruye_el_indice():
+    catalogo = Catalogo([{'id': 1, 'nombre': 'Manzana', 'categoria': 'Fruta'}])
+    index = SuggestionIndex(catalogo.load, version=lambda: catalogo.version)
+    index.suggest('man')
+
+    # Otro worker escribe y, después, este también: hay un salto de versión
+    catalogo.products.append({'id': 2, 'nombre': 'Mango', 'categoria': 'Fruta'})
+    catalogo.version += 2
+    index.upsert({'id': 3, 'nombre': 'Pera', 'categoria': 'Fruta'}, catalogo.version)
+
+    assert nombres(index.suggest('man')) == ['Mango', 'Manzana']
+    assert catalogo.loads == 2
+
+
+def test_las_consultas_no_esperan_a_la_reconstruccion():
+    catalogo = Catalogo([{'id': 1, 'nombre': 'Manzana', 'categoria': 'Fruta'}])
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_load():
+        if catalogo.loads:
+            loading.set()
+            release.wait(5)
+        return catalogo.load()
+
+    index = SuggestionIndex(slow_load, version=lambda: catalogo.version)
+    index.suggest('man')
+    catalogo.version += 1
+
+    rebuild = threading.Thread(target=index.suggest, args=('man',))
+    rebuild.start()
+    assert loading.wait(5)
+    # Mientras otro hilo recarga el catálogo se responde con el índice anterior
+    assert nombres(index.suggest('man')) == ['Manzana']
+    release.set()
+    rebuild.join(5)
+    assert catalogo.loads == 2
@@ -0,0 +1,247 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from mysql.connector import Error
+
+# Estados de un trabajo
+PENDIENTE = 'pendiente'
+EN_PROCESO = 'en_proceso'
+CANCELANDO = 'cancelando'
+CANCELADO = 'cancelado'
+COMPLETADO = 'completado'
+FALLIDO = 'fallido'
+INTERRUMPIDO = 'interrumpido'
+
+ESTADOS_ACTIVOS = (PENDIENTE, EN_PROCESO, CANCELANDO)
+
+CONTADORES = ('procesadas', 'insertadas', 'omitidas', 'fallidas')
+
+
+def process_owner():
+    """Identifica al proceso que ejecuta un trabajo: 'host:pid'"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def process_alive(pid):
+    """Indica si existe un proceso con ese pid en esta máquina"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Existe, pero es de otro usuario
+    return True
+
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS trabajos_importacion (
+        id VARCHAR(32) PRIMARY KEY,
+        tipo VARCHAR(10) NOT NULL,
+        archivo VARCHAR(255) NOT NULL,
+        estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+        procesadas INT NOT NULL DEFAULT 0,
+        insertadas INT NOT NULL DEFAULT 0,
+        omitidas INT NOT NULL DEFAULT 0,
+        fallidas INT NOT NULL DEFAULT 0,
+        mensaje TEXT,
+        propietario VARCHAR(100),
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_trabajos_estado (estado)
+    )
+'''
+
+
+class JobProgress:
+    """Progreso de un trabajo en ejecución
+
+    La tarea llama a `update(contadores)` al terminar cada lote: se guardan los
+    contadores en la tabla y se comprueba si alguien pidió cancelar (la
+    cancelación puede llegar desde cualquier worker, por eso se lee de MySQL).
+    """
+
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+
+    def update(self, counters):
+        """Guarda el progreso; devuelve False si el trabajo debe detenerse"""
+        estado = self.runner._save_progress(self.job_id, counters)
+        return estado != CANCELANDO and not self.runner._stopping
+
+
+class JobRunner:
+    """Ejecuta trabajos en segundo plano con un pool de hilos y una tabla persistente"""
+
+    def __init__(self, get_connection, max_workers=2, on_interrupted=None):
+        self._get_connection = get_connection
+        self.max_workers = max_workers
+        # on_interrupted(trabajo) limpia lo que deja un trabajo interrumpido (p. ej. su archivo)
+        self.on_interrupted = on_interrupted
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._stopping = False
+        self._running = set()
+
+    def _get_executor(self):
+        """Pool de hilos del proceso actual (los hilos no sobreviven a un fork)"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='trabajo')
+                self._pid = os.getpid()
+                self._stopping = False
+                self._running = set()
+            return self._executor
+
+    def _execute(self, sql, params=(), fetch=False, fetch_all=False):
+        """Ejecuta una sentencia sobre la tabla de trabajos"""
+        connection = self._get_connection()
+        if not connection:
+            raise Error('No se pudo conectar a MySQL')
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(sql, params)
+            if fetch_all:
+                return cursor.fetchall()
+            if fetch:
+                return cursor.fetchone()
+            connection.commit()
+            return cursor.rowcount
+        finally:
+            cursor.close()
+            connection.close()
+
+    def _interrupt(self, where, params):
+        """Marca como interrumpidos los trabajos activos que cumplan `where` y los limpia"""
+        placeholders = ', '.join(['%s'] * len(ESTADOS_ACTIVOS))
+        jobs = self._execute(
+            f'SELECT id, tipo FROM trabajos_importacion WHERE estado IN ({placeholders}) AND {where}',
+            ESTADOS_ACTIVOS + params, fetch_all=True
+        )
+        for job in jobs:
+            if self._execute(
+                f'UPDATE trabajos_importacion SET estado = %s, mensaje = %s '
+                f'WHERE id = %s AND estado IN ({placeholders})',
+                (INTERRUMPIDO, 'Interrumpido: el proceso que lo ejecutaba terminó', job['id']) + ESTADOS_ACTIVOS
+            ) and self.on_interrupted:
+                self.on_interrupted(job)
+        return jobs
+
+    def reclaim_orphans(self):
+        """Interrumpe los trabajos de procesos de esta máquina que ya no existen
+
+        Un worker reciclado o matado (timeout, SIGKILL) deja sus trabajos en
+        curso; se llama al arrancar cada worker nuevo.
+        """
+        placeholders = ', '.join(['%s'] * len(ESTADOS_ACTIVOS))
+        owners = self._execute(
+            f'SELECT DISTINCT propietario FROM trabajos_importacion '
+            f'WHERE estado IN ({placeholders}) AND propietario LIKE %s',
+            ESTADOS_ACTIVOS + (f'{socket.gethostname()}:%',), fetch_all=True
+        )
+        reclaimed = []
+        for row in owners:
+            pid = row['propietario'].rsplit(':', 1)[-1]
+            if pid.isdigit() and not process_alive(int(pid)):
+                reclaimed += self._interrupt('propietario = %s', (row['propietario'],))
+        return reclaimed
+
+    def shutdown(self, timeout=10):
+        """Detiene los trabajos de este proceso antes de que termine (quedan interrumpidos)
+
+        Los trabajos en curso se paran en su siguiente lote y los encolados
+        no llegan a empezar. Debe terminar antes de que gunicorn mate al worker.
+        """
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                return
+            self._stopping = True
+            executor = self._executor
+        executor.shutdown(wait=False, cancel_futures=True)
+        deadline = time.monotonic() + timeout
+        while self._running and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self._interrupt('propietario = %s', (process_owner(),))
+
+    def submit(self, tipo, archivo, task, job_id=None):
+        """Registra un trabajo y lo encola; devuelve su id inmediatamente
+
+        `task(progress)` recibe un JobProgress y devuelve el dict de contadores.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        self._execute(
+            'INSERT INTO trabajos_importacion (id, tipo, archivo, estado, propietario) VALUES (%s, %s, %s, %s, %s)',
+            (job_id, tipo, archivo, PENDIENTE, process_owner())
+        )
+        self._get_executor().submit(self._run, job_id, task)
+        return job_id
+
+    def get(self, job_id):
+        """Estado actual de un trabajo (o None si no existe)"""
+        job = self._execute('SELECT * FROM trabajos_importacion WHERE id = %s', (job_id,), fetch=True)
+        if job:
+            for field in ('fecha_creacion', 'fecha_actualizacion'):
+                if job.get(field):
+                    job[field] = str(job[field])
+        return job
+
+    def cancel(self, job_id):
+        """Pide la cancelación de un trabajo; devuelve False si ya había terminado"""
+        # Si todavía no empezó se cancela directamente
+        if self._execute('UPDATE trabajos_importacion SET estado = %s WHERE id = %s AND estado = %s',
+                         (CANCELADO, job_id, PENDIENTE)):
+            return True
+        return bool(self._execute('UPDATE trabajos_importacion SET estado = %s WHERE id = %s AND estado = %s',
+                                  (CANCELANDO, job_id, EN_PROCESO)))
+
+    def _save_progress(self, job_id, counters):
+        """Guarda los contadores (y el mensaje, si lo hay) y devuelve el estado actual del trabajo"""
+        assignments = ', '.join(f'{name} = %s' for name in CONTADORES)
+        params = tuple(counters.get(name, 0) for name in CONTADORES)
+        if counters.get('mensaje'):
+            assignments += ', mensaje = %s'
+            params += (counters['mensaje'],)
+        self._execute(f'UPDATE trabajos_importacion SET {assignments} WHERE id = %s', params + (job_id,))
+        job = self._execute('SELECT estado FROM trabajos_importacion WHERE id = %s', (job_id,), fetch=True)
+        return job['estado'] if job else CANCELANDO
+
+    def _finish(self, job_id, estado, counters=None, mensaje=None):
+        counters = counters or {}
+        assignments = ''.join(f', {name} = %s' for name in CONTADORES if name in counters)
+        self._execute(
+            f'UPDATE trabajos_importacion SET estado = %s, mensaje = %s{assignments} WHERE id = %s',
+            (estado, mensaje) + tuple(counters[name] for name in CONTADORES if name in counters) + (job_id,)
+        )
+
+    def _run(self, job_id, task):
+        """Cuerpo del hilo: ejecuta la tarea y registra el resultado"""
+        self._running.add(job_id)
+        try:
+            if not self._execute('UPDATE trabajos_importacion SET estado = %s WHERE id = %s AND estado = %s',
+                                 (EN_PROCESO, job_id, PENDIENTE)):
+                return  # Cancelado antes de empezar
+            started = time.monotonic()
+            counters = task(JobProgress(self, job_id))
+            job = self.get(job_id)
+            elapsed = time.monotonic() - started
+            detalle = f" ({counters['mensaje']})" if counters.get('mensaje') else ''
+            if job and job['estado'] == CANCELANDO:
+                self._finish(job_id, CANCELADO, counters, f'Cancelado tras {elapsed:.1f}s{detalle}')
+            elif self._stopping:
+                self._finish(job_id, INTERRUMPIDO, counters,
+                             f'Interrumpido tras {elapsed:.1f}s: el worker se detuvo{detalle}')
+            else:
+                self._finish(job_id, COMPLETADO, counters, f'Completado en {elapsed:.1f}s{detalle}')
+        except Exception as e:
+            print(f"Error en trabajo {job_id}: {e}")
+            try:
+                self._finish(job_id, FALLIDO, mensaje=str(e))
+            except Error as db_error:
+                print(f"Error al registrar fallo del trabajo {job_id}: {db_error}")
+        finally:
+            self._running.discard(job_id)